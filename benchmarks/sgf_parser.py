@@ -0,0 +1,63 @@
+"""
+Parses the bundled problems and a synthetic collection of long
+commented games, prints the parsing speed of each and of reading
+only the root node of the games. Run it from the repository root:
+
+    python -m benchmarks.sgf_parser [sgf directory]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+from tsumegolab.sgflib import SGFParser, escape_text
+from tsumegolab.utils.coord_utils import SGF_COORDS
+
+PROBLEMS = Path(__file__).parent.parent / "tests/problems/cho-1-elementary"
+
+
+def commented_collection(games: int = 20, moves: int = 200) -> str:
+    rng = random.Random(0)
+    words = ["black", "white", "ko", "atari", "[sic]", "C:\\go", "seki"]
+
+    def comment() -> str:
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 60)))
+        return escape_text(text)
+
+    def node(color: str) -> str:
+        point = rng.choice(SGF_COORDS) + rng.choice(SGF_COORDS)
+        return f";{color}[{point}]C[{comment()}]"
+
+    trees = []
+    for _ in range(games):
+        trunk = "".join(node("BW"[i % 2]) for i in range(moves))
+        variation = "".join(node("BW"[i % 2]) for i in range(10))
+        trees.append(
+            f"(;GM[1]SZ[19]C[{comment()}]{trunk}({variation})({variation}))"
+        )
+    return "\n".join(trees)
+
+
+def measure(name: str, texts: list[str], repeat: int = 3, root_only=False):
+    size = sum(map(len, texts))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            if root_only:
+                SGFParser(text).parse_root()
+            else:
+                SGFParser(text).parse_collection()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name}: {size / 2**20:.2f} MiB in {best:.3f}s")
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else PROBLEMS
+    measure(
+        directory.name,
+        [path.read_text() for path in sorted(directory.glob("*.sgf"))],
+    )
+    measure("commented games", [commented_collection()])
+    measure("root nodes", [commented_collection()], root_only=True)
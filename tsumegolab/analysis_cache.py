@@ -0,0 +1,330 @@
+import hashlib
+import json
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from threading import Event, Lock
+
+import numpy as np
+
+from tsumegolab.kata_analysis import (
+    BaseKataAnalysis,
+    KataRequest,
+    KataResponse,
+    MovesDict,
+    OnUpdate,
+    parse_response,
+)
+from tsumegolab.utils.board_utils import (
+    RotationSpec,
+    normalize_coord,
+    normalize_rotation,
+    rotate_board,
+    rotate_coord,
+)
+from tsumegolab.utils.coord_utils import gtp_to_int_coord, int_to_gtp_coord
+
+IDENTITY: RotationSpec = (False, False, False)
+
+# request fields which do not change the analysis result
+UNCACHED_FIELDS = {
+    "id",
+    "priority",
+    "priorities",
+    "report_during_search_every",
+}
+
+
+def _map_location(location: str, height: int, to_height: int, mapping):
+    if location == "pass":
+        return location
+    return int_to_gtp_coord(
+        mapping(gtp_to_int_coord(location, height)), to_height
+    )
+
+
+def canonicalize_request(
+    request: KataRequest,
+) -> tuple[KataRequest, RotationSpec]:
+    """
+    Rotates the request position into the normalized orientation used by
+    `Tsumego`, so that every orientation of a problem maps to one query.
+    """
+    shape = request.board_y_size, request.board_x_size
+
+    board = np.zeros(shape, dtype=np.int8)
+    for color, location in request.initial_stones or []:
+        if location != "pass":
+            board[gtp_to_int_coord(location, shape[0])] = (
+                1 if color == "B" else -1
+            )
+
+    spec = normalize_rotation(board)[1] if board.any() else IDENTITY
+    height, width = reversed(shape) if spec[2] else shape
+
+    normalize = partial(
+        _map_location,
+        height=shape[0],
+        to_height=height,
+        mapping=partial(normalize_coord, shape=shape, spec=spec),
+    )
+
+    def normalize_moves(moves_dicts: list[MovesDict] | None):
+        if moves_dicts is None:
+            return None
+        return [
+            moves_dict.model_copy(
+                update={"moves": sorted(map(normalize, moves_dict.moves))}
+            )
+            for moves_dict in moves_dicts
+        ]
+
+    canonical = request.model_copy(
+        update={
+            "initial_stones": sorted(
+                (color, normalize(location))
+                for color, location in request.initial_stones or []
+            ),
+            "moves": [
+                (color, normalize(location))
+                for color, location in request.moves
+            ],
+            "avoid_moves": normalize_moves(request.avoid_moves),
+            "allow_moves": normalize_moves(request.allow_moves),
+            "board_x_size": width,
+            "board_y_size": height,
+        }
+    )
+    return canonical, spec
+
+
+def request_key(request: KataRequest) -> str:
+    fields = request.model_dump(
+        mode="json",
+        by_alias=True,
+        exclude_none=True,
+        exclude=UNCACHED_FIELDS,
+        warnings=False,
+    )
+    return hashlib.sha256(
+        json.dumps(fields, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def rotate_response(
+    response: KataResponse,
+    shape: tuple[int, int],
+    spec: RotationSpec,
+) -> KataResponse:
+    """
+    Maps a response for the canonical request back to the orientation
+    of the original request with board `shape`.
+    """
+    if spec == IDENTITY:
+        return response
+
+    height = shape[0]
+    canonical_shape = tuple(reversed(shape)) if spec[2] else shape
+
+    rotate = partial(
+        _map_location,
+        height=canonical_shape[0],
+        to_height=height,
+        mapping=partial(rotate_coord, shape=shape, spec=spec),
+    )
+
+    def rotate_values(values: np.ndarray | None) -> np.ndarray | None:
+        if values is None:
+            return None
+        values = np.reshape(values, canonical_shape)
+        return np.ascontiguousarray(rotate_board(values, spec))
+
+    move_infos = []
+    for move_info in response.move_infos:
+        is_symmetry_of = move_info.is_symmetry_of
+        if is_symmetry_of is not None:
+            is_symmetry_of = rotate(is_symmetry_of)
+
+        move_infos.append(
+            move_info.model_copy(
+                update={
+                    "move": rotate(move_info.move),
+                    "pv": list(map(rotate, move_info.pv)),
+                    "is_symmetry_of": is_symmetry_of,
+                    "ownership": rotate_values(move_info.ownership),
+                    "ownership_stdev": rotate_values(
+                        move_info.ownership_stdev
+                    ),
+                }
+            )
+        )
+
+    policy = response.policy
+    if policy is not None:
+        policy = np.append(rotate_values(policy[:-1]).ravel(), policy[-1])
+
+    return response.model_copy(
+        update={
+            "move_infos": move_infos,
+            "ownership": rotate_values(response.ownership),
+            "ownership_stdev": rotate_values(response.ownership_stdev),
+            "policy": policy,
+        }
+    )
+
+
+class KataAnalysisCache(BaseKataAnalysis):
+    """
+    Caches responses of the wrapped analysis by canonical position. Recent
+    responses are kept in memory, all of them are stored in SQLite, so
+    positions analysed by previous runs never reach the engine again.
+    """
+
+    def __init__(
+        self,
+        analysis: BaseKataAnalysis,
+        path: Path | str = ":memory:",
+        maxsize: int = 4096,
+    ):
+        self.analysis = analysis
+        self.maxsize = maxsize
+        self.window = analysis.window
+
+        self._memory: OrderedDict[str, KataResponse] = OrderedDict()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses"
+            " (key TEXT PRIMARY KEY, response TEXT NOT NULL)"
+        )
+        self._lock = Lock()
+
+        self._futures: dict[str, Future[KataResponse]] = {}
+        self._terminated: dict[str, Event] = {}
+
+    @property
+    def engine_visits(self) -> int:
+        return self.analysis.engine_visits
+
+    def _remember(self, key: str, response: KataResponse):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str, shape: tuple[int, int]) -> KataResponse | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response = parse_response(row[0], shape)
+            self._remember(key, response)
+            return response
+
+    def _store(self, key: str, response: KataResponse):
+        with self._lock:
+            self._remember(key, response)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?)",
+                (key, response.model_dump_json(by_alias=True)),
+            )
+            self._db.commit()
+
+    def _on_response(
+        self,
+        request: KataRequest,
+        spec: RotationSpec,
+        key: str,
+        future: Future[KataResponse],
+        terminated: Event,
+        _: Future[KataResponse],
+    ):
+        with self._lock:
+            self._terminated.pop(request.id, None)
+
+        try:
+            response = self.analysis.get(request.id)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        # early terminated search is not what the key promises
+        if not terminated.is_set():
+            self._store(key, response)
+        future.set_result(self._restore(request, spec, response))
+
+    @staticmethod
+    def _restore(
+        request: KataRequest, spec: RotationSpec, response: KataResponse
+    ) -> KataResponse:
+        shape = request.board_y_size, request.board_x_size
+        response = rotate_response(response, shape, spec)
+        return response.model_copy(update={"id": request.id})
+
+    def send_request(
+        self, request: KataRequest, on_update: OnUpdate | None = None
+    ) -> Future[KataResponse]:
+        canonical, spec = canonicalize_request(request)
+        key = request_key(canonical)
+
+        future = Future()
+        with self._lock:
+            self._futures[request.id] = future
+
+        shape = canonical.board_y_size, canonical.board_x_size
+        if (response := self._load(key, shape)) is not None:
+            future.set_result(self._restore(request, spec, response))
+            return future
+
+        terminated = Event()
+        with self._lock:
+            self._terminated[request.id] = terminated
+
+        report = None
+        if on_update is not None:
+
+            def report(update: KataResponse) -> bool | None:
+                stop = on_update(self._restore(request, spec, update))
+                if stop:
+                    terminated.set()
+                return stop
+
+        self.analysis.send_request(canonical, report).add_done_callback(
+            partial(self._on_response, request, spec, key, future, terminated)
+        )
+
+        return future
+
+    def get(
+        self, request_id: str, timeout: float | None = None
+    ) -> KataResponse:
+        with self._lock:
+            future = self._futures[request_id]
+
+        try:
+            return future.result(timeout)
+        finally:
+            if future.done():
+                with self._lock:
+                    if self._futures.get(request_id) is future:
+                        del self._futures[request_id]
+
+    def terminate(self, request_id: str):
+        with self._lock:
+            terminated = self._terminated.get(request_id)
+
+        if terminated is not None:
+            terminated.set()
+            self.analysis.terminate(request_id)
+
+    def close(self):
+        self.analysis.close()
+        self._db.close()
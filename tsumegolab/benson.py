@@ -0,0 +1,57 @@
+import numpy as np
+from scipy.ndimage import label
+
+from tsumegolab.board import Color, adjacent
+
+
+def unconditional_life(
+    board: np.ndarray, color: Color
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Benson's algorithm. Returns the masks of the chains of `color` which
+    stay alive whatever the opponent plays, even if `color` passes every
+    move, and of the regions they enclose where the opponent can never
+    live. A region is vital to a chain when all its empty points are
+    liberties of the chain; chains with less than two vital regions and
+    regions next to such chains are dropped until nothing changes.
+    """
+    chains, num_chains = label(board == color)
+    regions, num_regions = label(board != color)
+    empty = board == Color.EMPTY
+    # chains next to every point
+    around = adjacent(chains)
+
+    neighbours: dict[int, set[int]] = {}
+    vital: dict[int, set[int]] = {
+        chain: set() for chain in range(1, num_chains + 1)
+    }
+    for region in range(1, num_regions + 1):
+        points = regions == region
+        neighbours[region] = set(np.unique(around[:, points]).tolist()) - {0}
+
+        around_empty = around[:, points & empty]
+        for chain in neighbours[region]:
+            if np.all(np.any(around_empty == chain, axis=0)):
+                vital[chain].add(region)
+
+    alive = set(vital)
+    healthy = set(neighbours)
+    while True:
+        alive = {chain for chain in alive if len(vital[chain] & healthy) > 1}
+        enclosed = {
+            region for region in healthy if neighbours[region] <= alive
+        }
+        if enclosed == healthy:
+            break
+        healthy = enclosed
+
+    return (
+        np.isin(chains, list(alive)) & (chains > 0),
+        np.isin(regions, list(healthy)) & (regions > 0),
+    )
+
+
+def alive_stones(board: np.ndarray, color: Color) -> np.ndarray:
+    """Mask of the stones of `color` which are unconditionally alive."""
+    stones, _ = unconditional_life(board, color)
+    return stones
@@ -0,0 +1,354 @@
+from dataclasses import dataclass
+from functools import cache
+
+import numpy as np
+
+from tsumegolab.board import (
+    Color,
+    Coord,
+    InvalidMove,
+    KoRule,
+    Move,
+    legal_moves_mask,
+    zobrist_keys,
+)
+
+# no ko point
+NO_POINT = -1
+
+
+@dataclass(frozen=True, slots=True)
+class Geometry:
+    """Bit masks of a board shape, point (x, y) is bit x * height + y."""
+
+    width: int
+    height: int
+    full: int
+    # points with y other than 0 and other than height - 1
+    not_first: int
+    not_last: int
+    neighbours: tuple[int, ...]
+    black_keys: tuple[int, ...]
+    white_keys: tuple[int, ...]
+    white_turn_key: int
+
+    def dilate(self, bits: int) -> int:
+        """`bits` and their neighbours."""
+        return (
+            bits
+            | (bits << self.height)
+            | (bits >> self.height)
+            | ((bits << 1) & self.not_first)
+            | ((bits >> 1) & self.not_last)
+        ) & self.full
+
+    def flood(self, stones: int, seed: int) -> int:
+        """The chain of `stones` containing the `seed` bit."""
+        chain = seed
+        while grown := self.dilate(chain) & stones & ~chain:
+            chain |= grown
+        return chain
+
+    def stones_key(self, bits: int, color: Color) -> int:
+        keys = self.black_keys if color == Color.BLACK else self.white_keys
+        key = 0
+        while bits:
+            low = bits & -bits
+            key ^= keys[low.bit_length() - 1]
+            bits ^= low
+        return key
+
+
+@cache
+def geometry(shape: tuple[int, int]) -> Geometry:
+    width, height = shape
+    first = sum(1 << (x * height) for x in range(width))
+    full = (1 << (width * height)) - 1
+
+    neighbours = []
+    for x in range(width):
+        for y in range(height):
+            bits = 0
+            for adj_x, adj_y in (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1):
+                if 0 <= adj_x < width and 0 <= adj_y < height:
+                    bits |= 1 << (adj_x * height + adj_y)
+            neighbours.append(bits)
+
+    black, white, white_turn_key = zobrist_keys(shape)
+    return Geometry(
+        width,
+        height,
+        full,
+        full & ~first,
+        full & ~(first << (height - 1)),
+        tuple(neighbours),
+        tuple(key for column in black for key in column),
+        tuple(key for column in white for key in column),
+        white_turn_key,
+    )
+
+
+def to_bits(mask: np.ndarray) -> int:
+    packed = np.packbits(mask.ravel(), bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def from_bits(bits: int, shape: tuple[int, int]) -> np.ndarray:
+    size = shape[0] * shape[1]
+    packed = np.frombuffer(bits.to_bytes((size + 7) // 8, "little"), np.uint8)
+    return np.unpackbits(packed, count=size, bitorder="little").reshape(shape)
+
+
+@dataclass(slots=True)
+class BitMoveRecord:
+    """The position before a move, ints are immutable so it is shared."""
+
+    move: Move
+    black: int
+    white: int
+    ko: int
+    hash: int
+    captures: tuple[int, int]
+
+
+class BitBoard:
+    """
+    `Board` with black and white stones kept as bits of two Python ints.
+    Chains and liberties are found with shifts and masks instead of
+    being tracked, so a copy is a handful of ints and undo restores the
+    ints the move replaced. The rules, hashes and the move and undo API
+    are those of `Board`.
+    """
+
+    __slots__ = (
+        "black",
+        "white",
+        "turn",
+        "suicide_allowed",
+        "ko_rule",
+        "initial_board",
+        "history",
+        "hash",
+        "_geometry",
+        "_ko",
+        "_captures",
+        "_seen",
+    )
+
+    def __init__(
+        self,
+        board_or_shape: tuple[int, int] | np.ndarray,
+        turn: Color = Color.BLACK,
+        suicide_allowed: bool = False,
+        ko_rule: KoRule = KoRule.SIMPLE,
+    ):
+        if isinstance(board_or_shape, tuple):
+            board_or_shape = np.zeros(board_or_shape, dtype=np.int8)
+
+        self._geometry = geometry(board_or_shape.shape)
+        self.black = to_bits(board_or_shape == Color.BLACK)
+        self.white = to_bits(board_or_shape == Color.WHITE)
+
+        self.turn = turn
+        self.suicide_allowed = suicide_allowed
+        self.ko_rule = ko_rule
+
+        self.initial_board = np.array(board_or_shape, dtype=np.int8)
+        self.history: list[BitMoveRecord] = []
+
+        self._ko = NO_POINT
+        # stones captured by black and by white
+        self._captures = 0, 0
+
+        self.hash = self._geometry.stones_key(
+            self.black, Color.BLACK
+        ) ^ self._geometry.stones_key(self.white, Color.WHITE)
+        if turn == Color.WHITE:
+            self.hash ^= self._geometry.white_turn_key
+
+        # superko keys of every position since the start
+        self._seen: set[int] = set()
+        if self.ko_rule != KoRule.SIMPLE:
+            self._seen.add(self._superko_key(self.hash, self.turn))
+
+    def copy(self) -> "BitBoard":
+        """A board which shares nothing mutable with this one."""
+        board = object.__new__(BitBoard)
+        for name in self.__slots__:
+            setattr(board, name, getattr(self, name))
+        board.history = self.history.copy()
+        board._seen = self._seen.copy()
+        return board
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._geometry.width, self._geometry.height
+
+    @property
+    def width(self):
+        return self._geometry.width
+
+    @property
+    def height(self):
+        return self._geometry.height
+
+    @property
+    def board(self) -> np.ndarray:
+        """The position as the int8 array of `Board`."""
+        black = from_bits(self.black, self.shape).astype(np.int8)
+        return black - from_bits(self.white, self.shape).astype(np.int8)
+
+    @property
+    def score(self) -> dict[Color, int]:
+        return dict(zip((Color.BLACK, Color.WHITE), self._captures))
+
+    @property
+    def ko_point(self) -> Coord | None:
+        """The point the player to move may not play by the ko rule."""
+        if self._ko == NO_POINT:
+            return None
+        return divmod(self._ko, self._geometry.height)
+
+    def _superko_key(self, position_hash: int, turn: Color) -> int:
+        # positional superko ignores the player to move
+        if self.ko_rule == KoRule.POSITIONAL and turn == Color.WHITE:
+            return position_hash ^ self._geometry.white_turn_key
+        return position_hash
+
+    def _record(self, coord: Coord | None) -> BitMoveRecord:
+        return BitMoveRecord(
+            Move(self.turn, coord),
+            self.black,
+            self.white,
+            self._ko,
+            self.hash,
+            self._captures,
+        )
+
+    def move(self, x: int, y: int):
+        geometry = self._geometry
+        if not (0 <= x < geometry.width and 0 <= y < geometry.height):
+            raise InvalidMove("invalid point")
+
+        point = x * geometry.height + y
+        stone = 1 << point
+        if (self.black | self.white) & stone:
+            raise InvalidMove("point not empty")
+
+        if self.turn == Color.BLACK:
+            own, opponent = self.black | stone, self.white
+        else:
+            own, opponent = self.white | stone, self.black
+        empty = geometry.full & ~(own | opponent)
+
+        captured = 0
+        around = geometry.neighbours[point] & opponent
+        while around:
+            chain = geometry.flood(opponent, around & -around)
+            if not geometry.dilate(chain) & empty:
+                captured |= chain
+            around &= ~chain
+        if captured and point == self._ko:
+            raise InvalidMove("ko violation")
+        opponent &= ~captured
+        empty |= captured
+
+        chain = geometry.flood(own, stone)
+        liberties = geometry.dilate(chain) & empty
+        suicide = 0
+        if not liberties:
+            if chain == stone or not self.suicide_allowed:
+                raise InvalidMove("suicide move")
+            own &= ~chain
+            suicide = chain
+
+        next_hash = (
+            self.hash
+            ^ geometry.white_turn_key
+            ^ geometry.stones_key(stone ^ suicide, self.turn)
+            ^ geometry.stones_key(captured, -self.turn)
+        )
+        if self.ko_rule != KoRule.SIMPLE:
+            next_key = self._superko_key(next_hash, -self.turn)
+            if next_key in self._seen:
+                raise InvalidMove("superko violation")
+            self._seen.add(next_key)
+
+        self.history.append(self._record((x, y)))
+
+        # stones captured by a single stone with no other liberty
+        self._ko = NO_POINT
+        if (
+            captured.bit_count() == 1
+            and chain == stone
+            and liberties == captured
+        ):
+            self._ko = captured.bit_length() - 1
+
+        black, white = self._captures
+        captures = captured.bit_count(), suicide.bit_count()
+        if self.turn == Color.BLACK:
+            self.black, self.white = own, opponent
+            self._captures = black + captures[0], white + captures[1]
+        else:
+            self.white, self.black = own, opponent
+            self._captures = black + captures[1], white + captures[0]
+
+        self.turn = -self.turn
+        self.hash = next_hash
+
+    def check_move(self, x: int, y: int):
+        """Raises `InvalidMove` where `move` would, without playing."""
+        self.move(x, y)
+        self.undo()
+
+    def pass_move(self):
+        """Passes the turn, which also lifts the ko ban."""
+        self.history.append(self._record(None))
+        self._ko = NO_POINT
+        self.turn = -self.turn
+        self.hash ^= self._geometry.white_turn_key
+
+    def legal_moves_mask(self, color: Color | None = None) -> np.ndarray:
+        """
+        Boolean mask of the points where `color`, the player to move by
+        default, may play. The ko point and, under superko, the moves
+        repeating a position are only forbidden to the player to move.
+        """
+        if color is None:
+            color = self.turn
+
+        mask = legal_moves_mask(self.board, color, self.suicide_allowed)
+        if color != self.turn:
+            return mask
+
+        if (ko := self.ko_point) is not None:
+            mask[ko] = False
+
+        if self.ko_rule != KoRule.SIMPLE:
+            for x, y in np.argwhere(mask):
+                try:
+                    self.move(int(x), int(y))
+                except InvalidMove:
+                    mask[x, y] = False
+                else:
+                    self.undo()
+
+        return mask
+
+    def undo(self) -> Move:
+        """Takes back the last move."""
+        if not self.history:
+            raise InvalidMove("no move to undo")
+
+        record = self.history.pop()
+        if record.move.coord is not None and self.ko_rule != KoRule.SIMPLE:
+            self._seen.discard(self._superko_key(self.hash, self.turn))
+
+        self.black, self.white = record.black, record.white
+        self._ko = record.ko
+        self.hash = record.hash
+        self._captures = record.captures
+        self.turn = record.move.color
+
+        return record.move
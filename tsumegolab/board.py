@@ -1,12 +1,16 @@
 from collections import defaultdict
 from dataclasses import dataclass
-from enum import IntEnum
+from enum import IntEnum, StrEnum
+from functools import cache
 from typing import Iterator
 
 import numpy as np
+from scipy.ndimage import label
 
 Coord = tuple[int, int]
 
+ZOBRIST_SEED = 0x7E5E60
+
 
 class InvalidMove(Exception):
     pass
@@ -18,10 +22,107 @@ class Color(IntEnum):
     WHITE = -1
 
 
-@dataclass
+class KoRule(StrEnum):
+    SIMPLE = "SIMPLE"
+    POSITIONAL = "POSITIONAL"
+    SITUATIONAL = "SITUATIONAL"
+
+
+@dataclass(slots=True)
 class Move:
     color: Color
-    coord: Coord
+    # None is a pass
+    coord: Coord | None
+
+
+# kept root, merged root, merged stones count and both liberty sets
+Merge = tuple[Coord, Coord, int, set[Coord], set[Coord]]
+# root, stones and liberties of a chain taken off the board
+Chain = tuple[Coord, list[Coord], set[Coord]]
+
+
+@dataclass(slots=True)
+class MoveRecord:
+    """What a move changed, enough to undo it without a board copy."""
+
+    move: Move
+    merges: list[Merge]
+    captured: list[Chain]
+    suicide: Chain | None
+    ko: Coord | None
+    hash: int
+
+
+@cache
+def zobrist_keys(shape: tuple[int, int]) -> tuple[list, list, int]:
+    """
+    Random 64-bit keys of black and white stones on every point and of
+    white to move. The seed is fixed, so hashes are stable across runs.
+    """
+    rng = np.random.default_rng([ZOBRIST_SEED, *shape])
+    keys = rng.integers(0, 2**64, size=(2, *shape), dtype=np.uint64)
+    black, white = keys.tolist()
+    return black, white, int(rng.integers(0, 2**64, dtype=np.uint64))
+
+
+def adjacent(array: np.ndarray, fill=0) -> np.ndarray:
+    """
+    The values of the 4 neighbours of every point of the last two axes,
+    `fill` off board, stacked along a new first axis.
+    """
+    padding = [(0, 0)] * (array.ndim - 2) + [(1, 1), (1, 1)]
+    padded = np.pad(array, padding, constant_values=fill)
+    return np.stack(
+        [
+            padded[..., :-2, 1:-1],
+            padded[..., 2:, 1:-1],
+            padded[..., 1:-1, :-2],
+            padded[..., 1:-1, 2:],
+        ]
+    )
+
+
+def liberty_counts(labels: np.ndarray, empty: np.ndarray) -> np.ndarray:
+    """Liberties of every chain of `labels`, indexed by the label."""
+    neighbours = adjacent(labels)
+    points = np.arange(labels.size).reshape(labels.shape)
+    is_liberty = (neighbours > 0) & empty
+
+    pairs = np.unique(
+        neighbours[is_liberty].astype(np.int64) * labels.size
+        + np.broadcast_to(points, neighbours.shape)[is_liberty]
+    )
+    counts = np.bincount(pairs // labels.size, minlength=labels.max() + 1)
+    counts[0] = 0
+    return counts
+
+
+def legal_moves_mask(
+    board: np.ndarray, color: Color, suicide_allowed: bool = False
+) -> np.ndarray:
+    """
+    Empty points where `color` may play, ko aside. A move is legal when
+    it has an empty neighbour, joins a chain with another liberty,
+    captures a chain in atari or, with `suicide_allowed`, takes more
+    than one stone off the board.
+    """
+    empty = board == Color.EMPTY
+    own, _ = label(board == color)
+    opponent, _ = label(board == -color)
+
+    own_neighbours = adjacent(own)
+    opponent_neighbours = adjacent(opponent)
+    own_liberties = liberty_counts(own, empty)[own_neighbours]
+    opponent_liberties = liberty_counts(opponent, empty)[opponent_neighbours]
+
+    has_liberty = adjacent(empty, False).any(axis=0)
+    connects = (own_liberties > 1).any(axis=0)
+    captures = (opponent_liberties == 1).any(axis=0)
+    legal = has_liberty | connects | captures
+    if suicide_allowed:
+        legal |= (own_neighbours > 0).any(axis=0)
+
+    return empty & legal
 
 
 class Board:
@@ -30,6 +131,7 @@ class Board:
         board_or_shape: tuple[int, int] | np.ndarray,
         turn: Color = Color.BLACK,
         suicide_allowed: bool = False,
+        ko_rule: KoRule = KoRule.SIMPLE,
     ):
         if isinstance(board_or_shape, tuple):
             self.board = np.zeros(board_or_shape, dtype=np.int8)
@@ -38,9 +140,41 @@ class Board:
 
         self.turn = turn
         self.suicide_allowed = suicide_allowed
+        self.ko_rule = ko_rule
 
+        self.initial_board = np.copy(self.board)
         self.score: dict[Color, int] = defaultdict(int)
-        self.history: list[tuple[np.ndarray, Move, dict[Color, int]]] = []
+        self.history: list[MoveRecord] = []
+
+        # every stone points to the root of its chain, the root keeps the
+        # chain stones and liberties up to date, so a move only has to
+        # look at its neighbours
+        self._roots: dict[Coord, Coord] = {}
+        self._stones: dict[Coord, list[Coord]] = {}
+        self._chain_liberties: dict[Coord, set[Coord]] = {}
+        # the point the last move forbids by the simple ko rule
+        self._ko: Coord | None = None
+
+        # zobrist hash of the stones and the player to move
+        (
+            self._black_keys,
+            self._white_keys,
+            self._white_turn_key,
+        ) = zobrist_keys(self.shape)
+        self.hash = self._white_turn_key if turn == Color.WHITE else 0
+
+        stones = [
+            ((int(x), int(y)), Color(self.board[x, y]))
+            for x, y in np.argwhere(self.board)
+        ]
+        self.board[...] = Color.EMPTY
+        for coord, color in stones:
+            self._add_stone(coord, color)
+
+        # superko keys of every position since the start
+        self._seen: set[int] = set()
+        if self.ko_rule != KoRule.SIMPLE:
+            self._seen.add(self._superko_key(self.hash, self.turn))
 
     @property
     def shape(self):
@@ -75,89 +209,292 @@ class Board:
         if y < self.height - 1:
             yield x, y + 1
 
-    def _get_group(self, coord: Coord) -> set[Coord]:
-        color = self._get_color(coord)
+    def _stone_key(self, coord: Coord, color: Color) -> int:
+        x, y = coord
+        if color == Color.BLACK:
+            return self._black_keys[x][y]
+        return self._white_keys[x][y]
+
+    def _superko_key(self, position_hash: int, turn: Color) -> int:
+        # positional superko ignores the player to move
+        if self.ko_rule == KoRule.POSITIONAL and turn == Color.WHITE:
+            return position_hash ^ self._white_turn_key
+        return position_hash
 
-        to_expand = {coord}
-        group = set()
+    def _adjacent_roots(self, coord: Coord, color: Color) -> set[Coord]:
+        return {
+            self._roots[adj_coord]
+            for adj_coord in self._iter_adjacent(coord)
+            if self.board[adj_coord] == color
+        }
 
-        while to_expand:
-            coord = to_expand.pop()
-            to_expand |= {
-                adj_coord
-                for adj_coord in self._iter_adjacent(coord)
-                if self._get_color(*adj_coord) == color
-            }
+    def _merge(self, root: Coord, other: Coord) -> Merge:
+        # the smaller chain joins the larger one
+        if len(self._stones[root]) < len(self._stones[other]):
+            root, other = other, root
+
+        stones = self._stones.pop(other)
+        for coord in stones:
+            self._roots[coord] = root
+        self._stones[root] += stones
+
+        # the old sets are kept as they are for undo
+        liberties = self._chain_liberties[root]
+        other_liberties = self._chain_liberties.pop(other)
+        self._chain_liberties[root] = liberties | other_liberties
+
+        return root, other, len(stones), liberties, other_liberties
+
+    def _unmerge(self, merge: Merge):
+        root, other, size, liberties, other_liberties = merge
+
+        stones = self._stones[root]
+        self._stones[other] = stones[-size:]
+        del stones[-size:]
+        for coord in self._stones[other]:
+            self._roots[coord] = other
+
+        self._chain_liberties[root] = liberties
+        self._chain_liberties[other] = other_liberties
+
+    def _add_stone(
+        self, coord: Coord, color: Color
+    ) -> tuple[Coord, list[Merge]]:
+        self.board[coord] = color
+        self.hash ^= self._stone_key(coord, color)
+        self._roots[coord] = root = coord
+        self._stones[root] = [coord]
+        self._chain_liberties[root] = set()
+        merges = []
+
+        for adj_coord in self._iter_adjacent(coord):
+            adj_color = self.board[adj_coord]
+            if adj_color == Color.EMPTY:
+                self._chain_liberties[root].add(adj_coord)
+                continue
+
+            adj_root = self._roots[adj_coord]
+            self._chain_liberties[adj_root].discard(coord)
+            if adj_color == color and adj_root != root:
+                merges.append(self._merge(root, adj_root))
+                root = merges[-1][0]
+
+        return root, merges
+
+    def _remove_stone(self, coord: Coord, merges: list[Merge]):
+        for merge in reversed(merges):
+            self._unmerge(merge)
+
+        del self._roots[coord]
+        del self._stones[coord]
+        del self._chain_liberties[coord]
+        self.board[coord] = Color.EMPTY
+
+        for adj_coord in self._iter_adjacent(coord):
+            if (adj_root := self._roots.get(adj_coord)) is not None:
+                self._chain_liberties[adj_root].add(coord)
+
+    def _remove_chain(self, root: Coord) -> Chain:
+        stones = self._stones.pop(root)
+        liberties = self._chain_liberties.pop(root)
+
+        color = Color(self.board[root])
+        for coord in stones:
+            del self._roots[coord]
+            self.board[coord] = Color.EMPTY
+            self.hash ^= self._stone_key(coord, color)
+
+        for coord in stones:
+            for adj_coord in self._iter_adjacent(coord):
+                if (adj_root := self._roots.get(adj_coord)) is not None:
+                    self._chain_liberties[adj_root].add(coord)
+
+        return root, stones, liberties
+
+    def _restore_chain(self, chain: Chain, color: Color):
+        root, stones, liberties = chain
+
+        for coord in stones:
+            for adj_coord in self._iter_adjacent(coord):
+                if (adj_root := self._roots.get(adj_coord)) is not None:
+                    self._chain_liberties[adj_root].discard(coord)
+
+        for coord in stones:
+            self._roots[coord] = root
+            self.board[coord] = color
+        self._stones[root] = stones
+        self._chain_liberties[root] = liberties
+
+    def _check_move(self, coord: Coord) -> tuple[set[Coord], bool]:
+        """
+        Finds the chains the move captures and whether it is a suicide,
+        raises `InvalidMove` before anything on the board is changed.
+        """
+        if self._get_color(coord) != Color.EMPTY:
+            raise InvalidMove("point not empty")
 
-            group.add(coord)
-            to_expand -= group
+        captured = {
+            root
+            for root in self._adjacent_roots(coord, -self.turn)
+            if self._chain_liberties[root] == {coord}
+        }
+        if captured:
+            if coord == self._ko:
+                raise InvalidMove("ko violation")
+            return captured, False
+
+        friends = self._adjacent_roots(coord, self.turn)
+        if any(
+            self.board[adj_coord] == Color.EMPTY
+            for adj_coord in self._iter_adjacent(coord)
+        ) or any(len(self._chain_liberties[root]) > 1 for root in friends):
+            return captured, False
+
+        if not friends or not self.suicide_allowed:
+            raise InvalidMove("suicide move")
+
+        return captured, True
+
+    def _next_hash(
+        self, coord: Coord, captured: set[Coord], suicide: bool
+    ) -> int:
+        """The hash after the move, computed without playing it."""
+        next_hash = self.hash ^ self._white_turn_key
+        next_hash ^= self._stone_key(coord, self.turn)
+
+        for root in captured:
+            for stone in self._stones[root]:
+                next_hash ^= self._stone_key(stone, -self.turn)
+
+        if suicide:
+            next_hash ^= self._stone_key(coord, self.turn)
+            for root in self._adjacent_roots(coord, self.turn):
+                for stone in self._stones[root]:
+                    next_hash ^= self._stone_key(stone, self.turn)
+
+        return next_hash
+
+    def _move(
+        self, coord: Coord, captured: set[Coord], suicide: bool
+    ) -> MoveRecord:
+        record = MoveRecord(
+            Move(self.turn, coord), [], [], None, self._ko, self.hash
+        )
+        root, record.merges = self._add_stone(coord, self.turn)
+
+        for captured_root in captured:
+            record.captured.append(self._remove_chain(captured_root))
+            self.score[self.turn] += len(record.captured[-1][1])
+
+        if suicide:
+            record.suicide = self._remove_chain(root)
+            self.score[-self.turn] += len(record.suicide[1])
+
+        self._ko = None
+        if (
+            len(record.captured) == 1
+            and len(record.captured[0][1]) == 1
+            and len(self._stones[root]) == 1
+            and self._chain_liberties[root] == {record.captured[0][0]}
+        ):
+            self._ko = record.captured[0][0]
 
-        return group
+        self.turn = -self.turn
+        self.hash ^= self._white_turn_key
 
-    def _push_history(self, move: Move):
-        self.history.append((np.copy(self.board), move, self.score))
+        if self.ko_rule != KoRule.SIMPLE:
+            self._seen.add(self._superko_key(self.hash, self.turn))
 
-    def _pop_history(self):
-        self.board, move, self.score = self.history.pop()
-        self.turn = move.color
+        return record
 
-    def _place_stone(self, coord: Coord):
-        if self._get_color(coord) != Color.EMPTY:
-            raise InvalidMove("point not empty")
+    def _legal_move(self, coord: Coord) -> tuple[set[Coord], bool]:
+        captured, suicide = self._check_move(coord)
 
-        self.board[coord] = self.turn
+        if self.ko_rule != KoRule.SIMPLE:
+            next_hash = self._next_hash(coord, captured, suicide)
+            if self._superko_key(next_hash, -self.turn) in self._seen:
+                raise InvalidMove("superko violation")
 
-    def _kill_group(self, group: set[Coord]):
-        self.board[tuple(zip(*group))] = Color.EMPTY
+        return captured, suicide
 
-    def _liberties(self, group: set[Coord]) -> set[Coord]:
-        return {
-            crd
-            for coord in group
-            for crd in self._iter_adjacent(coord)
-            if self._get_color(crd) == Color.EMPTY
-        }
+    def check_move(self, x: int, y: int):
+        """Raises `InvalidMove` where `move` would, without playing."""
+        self._legal_move((x, y))
 
-    def _process_killing(self, coord: Coord):
-        group = self._get_group(coord)
-        if not self._liberties(group):
-            self._kill_group(group)
-            self.score[self.turn] += len(group)
+    def move(self, x: int, y: int):
+        coord = x, y
+        self.history.append(self._move(coord, *self._legal_move(coord)))
+
+    def pass_move(self):
+        """Passes the turn, which also lifts the ko ban."""
+        self.history.append(
+            MoveRecord(
+                Move(self.turn, None), [], [], None, self._ko, self.hash
+            )
+        )
+        self._ko = None
+        self.turn = -self.turn
+        self.hash ^= self._white_turn_key
 
-    def _process_capture(self, coord: Coord):
-        for coord in self._iter_adjacent(coord):
-            if self._get_color(*coord) == -self.turn:
-                self._process_killing(*coord)
+    @property
+    def ko_point(self) -> Coord | None:
+        """The point the player to move may not play by the ko rule."""
+        return self._ko
 
-    def _process_suicide(self, coord: Coord):
-        group = self._get_group(coord)
+    def legal_moves_mask(self, color: Color | None = None) -> np.ndarray:
+        """
+        Boolean mask of the points where `color`, the player to move by
+        default, may play. The ko point and, under superko, the moves
+        repeating a position are only forbidden to the player to move.
+        """
+        if color is None:
+            color = self.turn
 
-        if not self._liberties(group):
-            if len(group) == 1 or not self.suicide_allowed:
-                raise InvalidMove("suicide move")
+        mask = legal_moves_mask(self.board, color, self.suicide_allowed)
+        if color != self.turn:
+            return mask
 
-            self._kill_group(group)
-            self.score[-self.turn] += len(group)
+        if self._ko is not None:
+            mask[self._ko] = False
 
-    def _process_ko(self):
-        if len(self.history) > 1:
-            prev_board, *_ = self.history[-2]
-            if np.array_equal(self.board, prev_board):
-                raise InvalidMove("ko violation")
+        if self.ko_rule != KoRule.SIMPLE:
+            for x, y in np.argwhere(mask):
+                coord = int(x), int(y)
+                next_hash = self._next_hash(coord, *self._check_move(coord))
+                if self._superko_key(next_hash, -self.turn) in self._seen:
+                    mask[coord] = False
 
-    def _move(self, coord: Coord):
-        self._place_stone(coord)
-        self._process_capture(coord)
-        self._process_suicide(coord)
-        self._process_ko()
+        return mask
 
-        self.turn = -self.turn
+    def undo(self) -> Move:
+        """Takes back the last move, in time of the stones it changed."""
+        if not self.history:
+            raise InvalidMove("no move to undo")
 
-    def move(self, x: int, y: int):
-        coord = x, y
-        move = Move(self.turn, coord)
-        self._push_history(move)
-        try:
-            self._move(coord)
-        except InvalidMove:
-            self._pop_history()
+        record = self.history.pop()
+        color = record.move.color
+
+        if record.move.coord is not None:
+            self._undo_stone(record)
+
+        self._ko = record.ko
+        self.hash = record.hash
+        self.turn = color
+
+        return record.move
+
+    def _undo_stone(self, record: MoveRecord):
+        color = record.move.color
+
+        if self.ko_rule != KoRule.SIMPLE:
+            self._seen.discard(self._superko_key(self.hash, self.turn))
+
+        if record.suicide is not None:
+            self._restore_chain(record.suicide, color)
+            self.score[-color] -= len(record.suicide[1])
+
+        for chain in reversed(record.captured):
+            self._restore_chain(chain, -color)
+            self.score[color] -= len(chain[1])
+
+        self._remove_stone(record.move.coord, record.merges)
@@ -0,0 +1,123 @@
+import numpy as np
+from scipy.ndimage import label
+
+from tsumegolab.board import Color, adjacent
+
+# connects the points of the same board only
+STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+STRUCTURE[1] = [
+    [0, 1, 0],
+    [1, 1, 1],
+    [0, 1, 0],
+]
+# a pass or no ko point
+NO_POINT = -1
+
+
+def without_liberties(stones: np.ndarray, empty: np.ndarray) -> np.ndarray:
+    """Stones of a batch of boards whose chain has no liberty left."""
+    chains, num_chains = label(stones, STRUCTURE)
+    touches_empty = adjacent(empty, False).any(axis=0)
+
+    has_liberty = np.zeros(num_chains + 1, dtype=bool)
+    has_liberty[chains[touches_empty & stones]] = True
+    return stones & ~has_liberty[chains]
+
+
+class BoardBatch:
+    """
+    N positions in an (N, H, W) int8 array. `move` plays one move on
+    every board in a single vectorized step with the rules of `Board`:
+    captures, suicide and simple ko. An illegal move leaves its board
+    as it was, so each board keeps its own player to move.
+    """
+
+    def __init__(
+        self,
+        boards: np.ndarray,
+        turns: np.ndarray | Color = Color.BLACK,
+        suicide_allowed: bool = False,
+    ):
+        self.boards = np.array(boards, dtype=np.int8)
+        self.turns = np.broadcast_to(
+            np.asarray(turns, dtype=np.int8), (len(self.boards),)
+        ).copy()
+        self.suicide_allowed = suicide_allowed
+
+        self.ko = np.full((len(self.boards), 2), NO_POINT, dtype=np.intp)
+        # stones captured by black and by white
+        self.score = np.zeros((len(self.boards), 2), dtype=np.int32)
+
+    @classmethod
+    def expand(
+        cls,
+        board: np.ndarray,
+        turn: Color,
+        moves_mask: np.ndarray,
+        suicide_allowed: bool = False,
+    ) -> tuple["BoardBatch", np.ndarray, np.ndarray]:
+        """
+        Plays every move of `moves_mask` on its own copy of `board`,
+        returns the batch, the coords of the moves and their legality.
+        """
+        coords = np.argwhere(moves_mask)
+        batch = cls(
+            np.repeat(board[np.newaxis], len(coords), axis=0),
+            turn,
+            suicide_allowed,
+        )
+        return batch, coords, batch.move(coords)
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.boards.shape[1:]
+
+    def move(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Plays `coords[i]` on board `i`, (-1, -1) is a pass. Returns
+        whether each move was legal.
+        """
+        coords = np.asarray(coords, dtype=np.intp).reshape(len(self), 2)
+        boards, turns = self.boards.copy(), self.turns[:, None, None]
+        index = np.arange(len(self))
+
+        passes = np.all(coords == NO_POINT, axis=1)
+        legal = passes | np.all((coords >= 0) & (coords < self.shape), axis=1)
+        x, y = np.where(legal & ~passes, coords.T, 0)
+
+        legal &= passes | (boards[index, x, y] == Color.EMPTY)
+        legal &= passes | ~np.all(coords == self.ko, axis=1)
+        play = legal & ~passes
+        boards[index[play], x[play], y[play]] = self.turns[play]
+
+        captured = without_liberties(boards == -turns, boards == Color.EMPTY)
+        boards[captured] = Color.EMPTY
+        captures = captured.sum(axis=(1, 2))
+
+        dead = without_liberties(boards == turns, boards == Color.EMPTY)
+        suicides = dead.sum(axis=(1, 2))
+        if self.suicide_allowed:
+            legal &= suicides != 1
+            boards[dead] = Color.EMPTY
+        else:
+            legal &= suicides == 0
+
+        # the capture of a single stone by a single stone in atari
+        alone = ~adjacent(boards == turns)[:, index, x, y].any(axis=0)
+        liberties = adjacent(boards == Color.EMPTY)[:, index, x, y].sum(axis=0)
+        is_ko = play & (captures == 1) & alone & (liberties == 1)
+        ko = np.full_like(self.ko, NO_POINT)
+        ko[is_ko] = np.argwhere(captured[is_ko])[:, 1:]
+
+        player = (self.turns == Color.WHITE).astype(np.intp)
+        self.score[index, player] += np.where(legal, captures, 0)
+        self.score[index, 1 - player] += np.where(legal, suicides, 0)
+
+        self.boards[legal] = boards[legal]
+        self.ko[legal] = ko[legal]
+        self.turns[legal] *= -1
+
+        return legal
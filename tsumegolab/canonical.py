@@ -0,0 +1,101 @@
+import hashlib
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from tsumegolab.board import Color
+from tsumegolab.utils.board_utils import (
+    ROTATION_SPECS,
+    RotationSpec,
+    rotate_board,
+    transform_board,
+)
+from tsumegolab.utils.kifu_utils import root_node_to_board, sgf_root_node
+
+
+@dataclass(frozen=True)
+class Symmetry:
+    """
+    One of the 8 board symmetries followed by a color swap, which also
+    swaps the player to move. It maps a problem to its canonical form.
+    """
+
+    spec: RotationSpec
+    swap_colors: bool
+
+    def apply(self, board: np.ndarray) -> np.ndarray:
+        board = transform_board(board, self.spec)
+        return -board if self.swap_colors else board
+
+    def restore(self, array: np.ndarray) -> np.ndarray:
+        """
+        Maps a board or an ownership of the canonical form back to the
+        problem, the inverse of `apply`.
+        """
+        array = rotate_board(array, self.spec)
+        return -array if self.swap_colors else array
+
+
+def canonical_form(
+    board: np.ndarray, player: Color = Color.BLACK
+) -> tuple[np.ndarray, Symmetry, str]:
+    """
+    The smallest of the 16 transforms of a problem with `player` to move,
+    the symmetry which gives it and its hash. Problems which are mirror
+    images or color swapped copies of each other share the hash.
+    """
+    board = np.asarray(board, dtype=np.int8)
+
+    best = None
+    for spec in ROTATION_SPECS:
+        for swap_colors in False, True:
+            symmetry = Symmetry(spec, swap_colors)
+            candidate = np.ascontiguousarray(symmetry.apply(board))
+            to_play = -player if swap_colors else player
+            order = candidate.shape, to_play, candidate.tobytes()
+            if best is None or order < best[0]:
+                best = order, candidate, symmetry
+
+    (shape, to_play, data), canonical, symmetry = best
+    key = hashlib.sha256(f"{shape}:{to_play}:".encode() + data).hexdigest()
+    return canonical, symmetry, key
+
+
+@dataclass
+class ProblemClass:
+    """Problems with the same canonical form and how each one maps to it."""
+
+    key: str
+    board: np.ndarray
+    members: dict[str, Symmetry] = field(default_factory=dict)
+
+    @property
+    def representative(self) -> str:
+        return next(iter(self.members))
+
+
+def index_problems(
+    boards: dict[str, np.ndarray],
+    players: dict[str, Color] | None = None,
+) -> dict[str, ProblemClass]:
+    """Groups problems by canonical form, black is to move by default."""
+    classes: dict[str, ProblemClass] = {}
+    for name, board in boards.items():
+        player = (players or {}).get(name, Color.BLACK)
+        canonical, symmetry, key = canonical_form(board, player)
+        problem_class = classes.setdefault(key, ProblemClass(key, canonical))
+        problem_class.members[name] = symmetry
+    return classes
+
+
+def index_sgf_directory(directory: Path | str) -> dict[str, ProblemClass]:
+    """Groups the SGF problems of `directory` by file name."""
+    boards, players = {}, {}
+    for path in sorted(Path(directory).glob("*.sgf")):
+        root_node = sgf_root_node(path)
+        boards[path.name] = root_node_to_board(root_node)
+        if root_node.get("PL", ["B"])[0].upper() == "W":
+            players[path.name] = Color.WHITE
+
+    return index_problems(boards, players)
@@ -0,0 +1,34 @@
+import asyncio
+
+import typer
+
+from tsumegolab.config import Settings
+from tsumegolab.engine_pool import KataEnginePool
+from tsumegolab.server import DEFAULT_PORT, serve
+
+app = typer.Typer()
+
+
+@app.callback()
+def main():
+    """Tsumego Lab."""
+
+
+@app.command(name="serve")
+def serve_command(
+    host: str = "localhost",
+    port: int = DEFAULT_PORT,
+    max_in_flight: int = 64,
+):
+    """Share warm KataGo engines with WebSocket clients."""
+    pool = KataEnginePool(Settings())
+    try:
+        asyncio.run(serve(pool, host, port, max_in_flight))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    app()
@@ -17,10 +17,20 @@ class Settings(BaseSettings):
 
     engine_path: FilePath = Field(default_factory=locate_katago_engine)
     config_path: FilePath = APP_ROOT / "config" / "katago_analysis.cfg"
-    output_path: DirectoryPath = APP_ROOT / "output"
+    output_path: DirectoryPath | None = None
+    num_engines: int = 1
+    cache_path: Path = APP_ROOT / "analysis_cache.sqlite3"
+    # validate every engine response with pydantic, for debugging
+    validate_responses: bool = False
 
     wall_distance: int = 4
     ownership_threshold: float = 2 / 3
+    # total visits the collection runner may spend, unlimited if None
+    visits_budget: int | None = None
+    # df-pn nodes and seconds spent on a problem before it goes to
+    # KataGo, 0 nodes is off
+    solver_nodes: int = 2000
+    solver_time: float = 0.25
 
 
 if __name__ == "__main__":
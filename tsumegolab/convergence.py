@@ -0,0 +1,82 @@
+from concurrent.futures import Future
+
+import numpy as np
+
+from tsumegolab.kata_analysis import (
+    BaseKataAnalysis,
+    KataRequest,
+    KataResponse,
+)
+from tsumegolab.tsumego import Tsumego
+
+
+class OwnershipConvergence:
+    """
+    `on_update` callback which stops the search once the verdict of
+    `Tsumego.is_correct` has settled: it either did not change for
+    `stable_reports` reports in a row, or for `clear_reports` reports in a
+    row it stayed the same with the threshold moved by `margin` both ways.
+    """
+
+    def __init__(
+        self,
+        tsumego: Tsumego,
+        stable_reports: int = 4,
+        clear_reports: int = 2,
+        margin: float = 0.15,
+    ):
+        self.tsumego = tsumego
+        self.stable_reports = stable_reports
+        self.clear_reports = clear_reports
+        self.margin = margin
+
+        self.verdicts: list[bool] = []
+        self._stable = 0
+        self._clear = 0
+
+    def __call__(self, response: KataResponse) -> bool:
+        if response.ownership is None:
+            return False
+
+        ownership = np.reshape(response.ownership, self.tsumego.board.shape)
+        verdict = self.tsumego.is_correct(ownership)
+
+        if self.verdicts and self.verdicts[-1] == verdict:
+            self._stable += 1
+        else:
+            self._stable = 1
+        self.verdicts.append(verdict)
+
+        if not self.tsumego.is_stable(ownership, self.margin):
+            self._clear = 0
+        elif self._stable == 1:
+            self._clear = 1
+        else:
+            self._clear += 1
+
+        return (
+            self._stable >= self.stable_reports
+            or self._clear >= self.clear_reports
+        )
+
+
+def send_converging_request(
+    analysis: BaseKataAnalysis,
+    request: KataRequest,
+    tsumego: Tsumego,
+    report_every: float = 0.5,
+    **kwargs,
+) -> Future[KataResponse]:
+    """
+    Sends the request with intermediate reports every `report_every`
+    seconds and terminates it as soon as `OwnershipConvergence` is met.
+    """
+    request = request.model_copy(
+        update={
+            "include_ownership": True,
+            "report_during_search_every": report_every,
+        }
+    )
+    return analysis.send_request(
+        request, OwnershipConvergence(tsumego, **kwargs)
+    )
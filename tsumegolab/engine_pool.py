@@ -0,0 +1,96 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Sequence
+
+from tsumegolab.config import Settings
+from tsumegolab.kata_analysis import (
+    BaseKataAnalysis,
+    KataAnalysis,
+    KataRequest,
+    KataResponse,
+    OnUpdate,
+)
+
+
+class KataEnginePool(BaseKataAnalysis):
+    """
+    Runs one `katago analysis` process per entry of `overrides` and sends
+    each request to the engine with the fewest requests in flight.
+    Responses are fetched by id just like with a single `KataAnalysis`.
+
+        pool = KataEnginePool(
+            config,
+            [{"numAnalysisThreads": 4}, {"numAnalysisThreads": 4}],
+        )
+    """
+
+    def __init__(
+        self,
+        config: Settings,
+        overrides: Sequence[dict[str, Any]] | None = None,
+    ):
+        if overrides is None:
+            overrides = [{}] * config.num_engines
+
+        if not overrides:
+            raise ValueError("pool needs at least one engine")
+
+        self.engines = [
+            KataAnalysis(config, override_config)
+            for override_config in overrides
+        ]
+
+        self.window *= len(self.engines)
+
+        self._routes: dict[str, KataAnalysis] = {}
+        self._routes_lock = Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return sum(engine.in_flight for engine in self.engines)
+
+    @property
+    def engine_visits(self) -> int:
+        return sum(engine.engine_visits for engine in self.engines)
+
+    def send_request(
+        self, request: KataRequest, on_update: OnUpdate | None = None
+    ) -> Future[KataResponse]:
+        with self._routes_lock:
+            engine = min(self.engines, key=lambda e: e.in_flight)
+            self._routes[request.id] = engine
+
+        return engine.send_request(request, on_update)
+
+    def get(
+        self, request_id: str, timeout: float | None = None
+    ) -> KataResponse:
+        with self._routes_lock:
+            engine = self._routes[request_id]
+
+        try:
+            response = engine.get(request_id, timeout)
+        except TimeoutError:
+            # still in flight, keep the route for the next attempt
+            raise
+        except Exception:
+            self._drop_route(request_id)
+            raise
+
+        self._drop_route(request_id)
+        return response
+
+    def terminate(self, request_id: str):
+        with self._routes_lock:
+            engine = self._routes.get(request_id)
+
+        if engine is not None:
+            engine.terminate(request_id)
+
+    def _drop_route(self, request_id: str):
+        with self._routes_lock:
+            self._routes.pop(request_id, None)
+
+    def close(self):
+        for engine in self.engines:
+            engine.close()
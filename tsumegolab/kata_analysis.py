@@ -1,10 +1,17 @@
-import os
+import asyncio
+import itertools
+import math
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from enum import StrEnum
+from functools import cache
 from pathlib import Path
 from subprocess import PIPE, Popen
-from threading import Thread
-from typing import Any
+from threading import Lock, Thread
+from typing import Any, Callable, Iterable, Iterator, Sequence
 
+import numpy as np
+import pydantic_core
 from loguru import logger
 from pydantic import (
     BaseModel,
@@ -13,14 +20,10 @@ from pydantic import (
     ValidationError,
     confloat,
     constr,
-)
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_incrementing,
+    field_serializer,
 )
 
+from tsumegolab.board import KoRule
 from tsumegolab.config import Settings
 
 CONFIG_PATH = Path(__file__).parent.parent / "config" / "katago_analysis.cfg"
@@ -47,10 +50,10 @@ class CamelCaseModel(BaseModel):
     model_config = ConfigDict(alias_generator=to_camel_case)
 
 
-class KoRule(StrEnum):
-    SIMPLE = "SIMPLE"
-    POSITIONAL = "POSITIONAL"
-    SITUATIONAL = "SITUATIONAL"
+def serialize_values(values: Sequence[float] | np.ndarray | None):
+    if values is None:
+        return None
+    return np.asarray(values).ravel().tolist()
 
 
 class ScoringRule(StrEnum):
@@ -129,6 +132,12 @@ class KataRequest(CamelCaseModel):
     priorities: list[int] | None = None
 
 
+class TerminateRequest(CamelCaseModel):
+    id: str
+    action: str = "terminate"
+    terminate_id: str
+
+
 class MoveInfo(CamelCaseModel):
     move: GTPLocation
     visits: int
@@ -145,11 +154,15 @@ class MoveInfo(CamelCaseModel):
     order: int
     is_symmetry_of: GTPLocation | None = None
     pv: list[GTPLocation]
-    pv_visits: int | None = None
-    pv_edge_visits: int | None = None
+    pv_visits: list[int] | None = None
+    pv_edge_visits: list[int] | None = None
     ownership: list[ClosedIntervalValue] | None = None
     ownership_stdev: list[NormalizedValue] | None = None
 
+    @field_serializer("ownership", "ownership_stdev")
+    def _serialize_values(self, values):
+        return serialize_values(values)
+
 
 class RootInfo(CamelCaseModel):
     winrate: float
@@ -173,7 +186,23 @@ class KataResponse(CamelCaseModel):
     rootInfo: RootInfo
     ownership: list[ClosedIntervalValue] | None = None
     ownership_stdev: list[NormalizedValue] | None = None
-    policy: list[NormalizedValue] | None = None
+    # -1 marks illegal moves
+    policy: list[float] | None = None
+
+    @field_serializer("ownership", "ownership_stdev", "policy")
+    def _serialize_values(self, values):
+        return serialize_values(values)
+
+    @field_serializer("move_infos")
+    def _serialize_move_infos(self, move_infos: Sequence[MoveInfo], info):
+        return [
+            move_info.model_dump(
+                mode=info.mode,
+                by_alias=info.by_alias,
+                exclude_none=info.exclude_none,
+            )
+            for move_info in move_infos
+        ]
 
 
 class KataErrorResponse(CamelCaseModel):
@@ -181,18 +210,286 @@ class KataErrorResponse(CamelCaseModel):
     error: str | None = None
     warning: str | None = None
     field: str | None = None
+    no_results: bool | None = None
 
 
-class KataAnalysis:
-    def __init__(self, config: Settings):
-        self.output_path = config.output_path
+class KataAnalysisError(Exception):
+    pass
 
-        cmd = [
-            str(config.engine_path),
-            "analysis",
-            "-config",
-            str(config.config_path),
-        ]
+
+# called with every `isDuringSearch` report, returns True to stop the search
+OnUpdate = Callable[[KataResponse], bool | None]
+
+
+def format_override_config(override_config: dict[str, Any]) -> str:
+    return ",".join(
+        f"{key}={str(value).lower() if isinstance(value, bool) else value}"
+        for key, value in override_config.items()
+    )
+
+
+def engine_command(
+    config: Settings, override_config: dict[str, Any] | None = None
+) -> list[str]:
+    cmd = [
+        str(config.engine_path),
+        "analysis",
+        "-config",
+        str(config.config_path),
+    ]
+    if override_config:
+        cmd += ["-override-config", format_override_config(override_config)]
+    return cmd
+
+
+@cache
+def _field_names(model: type[BaseModel]) -> dict[str, str]:
+    return {
+        field.alias or name: name for name, field in model.model_fields.items()
+    }
+
+
+def construct(model: type[BaseModel], data: dict[str, Any]) -> BaseModel:
+    """`model_construct` from aliased json keys, unknown keys are dropped."""
+    names = _field_names(model)
+    return model.model_construct(
+        **{names[key]: value for key, value in data.items() if key in names}
+    )
+
+
+def to_array(
+    values: list[float] | None, shape: tuple[int, ...]
+) -> np.ndarray | None:
+    if values is None:
+        return None
+    return np.array(values, dtype=np.float32).reshape(shape)
+
+
+def infer_shape(data: dict[str, Any]) -> tuple[int, int]:
+    size = len(data.get("ownership") or data.get("ownershipStdev") or [])
+    if not size and data.get("policy"):
+        size = len(data["policy"]) - 1
+
+    side = math.isqrt(size)
+    return side, side
+
+
+class MoveInfos(Sequence[MoveInfo]):
+    """Decoded `moveInfos`, each `MoveInfo` is built on first access."""
+
+    def __init__(
+        self, move_infos: list[dict[str, Any]], shape: tuple[int, int]
+    ):
+        self._data = move_infos
+        self._items: list[MoveInfo | None] = [None] * len(move_infos)
+        self.shape = shape
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if self._items[index] is None:
+            data = self._data[index]
+            self._items[index] = construct(
+                MoveInfo,
+                data
+                | {
+                    "ownership": to_array(data.get("ownership"), self.shape),
+                    "ownershipStdev": to_array(
+                        data.get("ownershipStdev"), self.shape
+                    ),
+                },
+            )
+        return self._items[index]
+
+
+def decode_response(
+    data: dict[str, Any],
+    shape: tuple[int, int] | None = None,
+    strict: bool = False,
+) -> KataResponse | KataErrorResponse:
+    """
+    Builds a response from decoded json without validating it. Ownership,
+    its stdev and moves ownership become float32 arrays of the board
+    `shape`, policy stays flat with the pass move last. The shape of a
+    square board is inferred when not given. `strict` validates the data
+    with pydantic first and reports an invalid response as an error.
+    """
+    if "moveInfos" not in data:
+        return KataErrorResponse.model_validate(data)
+
+    if strict:
+        try:
+            KataResponse.model_validate(data)
+        except ValidationError as e:
+            return KataErrorResponse.model_construct(
+                id=data.get("id"), error=f"invalid response: {e}"
+            )
+
+    if shape is None:
+        shape = infer_shape(data)
+
+    return construct(
+        KataResponse,
+        data
+        | {
+            "moveInfos": MoveInfos(data["moveInfos"], shape),
+            "rootInfo": construct(RootInfo, data["rootInfo"]),
+            "ownership": to_array(data.get("ownership"), shape),
+            "ownershipStdev": to_array(data.get("ownershipStdev"), shape),
+            "policy": to_array(data.get("policy"), (-1,)),
+        },
+    )
+
+
+def parse_response(
+    line: str,
+    shape: tuple[int, int] | None = None,
+    strict: bool = False,
+) -> KataResponse | KataErrorResponse:
+    return decode_response(pydantic_core.from_json(line), shape, strict)
+
+
+def response_error(response: KataErrorResponse) -> KataAnalysisError | None:
+    if response.error is not None:
+        return KataAnalysisError(
+            f"{response.id}: {response.error} ({response.field})"
+        )
+    if response.no_results:
+        return KataAnalysisError(f"{response.id}: terminated without results")
+
+    if response.warning is not None:
+        logger.warning(f"{response.id}: {response.warning}")
+    return None
+
+
+def should_terminate(on_update: OnUpdate, response: KataResponse) -> bool:
+    try:
+        return bool(on_update(response))
+    except Exception:
+        logger.exception(f"{response.id}: on_update failed")
+        return False
+
+
+def terminate_query(request_id: str) -> str:
+    return TerminateRequest.model_construct(
+        id=f"{request_id}-terminate", terminate_id=request_id
+    ).model_dump_json(by_alias=True)
+
+
+def coalescing_key(request: KataRequest) -> str:
+    """Requests with equal keys get the same response apart from the id."""
+    return request.model_dump_json(
+        by_alias=True,
+        exclude_none=True,
+        exclude={"id", "priority", "priorities"},
+    )
+
+
+def save_response(output_path: Path, request_id: str, line: str):
+    response_path = output_path / f"{request_id}.json"
+
+    with response_path.open("w") as file:
+        file.write(line)
+
+
+class BaseKataAnalysis(ABC):
+    # requests kept in flight by `analyze_many`
+    window: int = 16
+    # visits of the queries which reached an engine, a query in flight
+    # counts with the visits it asks for until its response comes back;
+    # answers shared by identical requests or served from a cache are free
+    engine_visits: int = 0
+
+    @abstractmethod
+    def send_request(
+        self, request: KataRequest, on_update: OnUpdate | None = None
+    ) -> Future[KataResponse]:
+        ...
+
+    @abstractmethod
+    def get(
+        self, request_id: str, timeout: float | None = None
+    ) -> KataResponse:
+        ...
+
+    @abstractmethod
+    def terminate(self, request_id: str):
+        ...
+
+    @abstractmethod
+    def close(self):
+        ...
+
+    def analyze_many(
+        self,
+        requests: Iterable[KataRequest],
+        window: int | None = None,
+        timeout: float | None = None,
+    ) -> Iterator[KataResponse]:
+        """
+        Keeps up to `window` requests in flight and yields responses
+        in completion order, sending the next request as soon as one
+        finishes so the engine never runs out of queued positions.
+        A request which fails is logged and skipped. Requests still in
+        flight when the iteration stops early are terminated.
+        """
+        requests = iter(requests)
+        window = window or self.window
+        pending = {
+            self.send_request(request): request.id
+            for request in itertools.islice(requests, window)
+        }
+
+        try:
+            while pending:
+                done, _ = wait(pending, timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"no response within {timeout}s")
+
+                for future in done:
+                    request_id = pending.pop(future)
+                    for request in itertools.islice(requests, 1):
+                        pending[self.send_request(request)] = request.id
+
+                    try:
+                        response = self.get(request_id)
+                    except KataAnalysisError as e:
+                        logger.error(f"Request failed: {e}")
+                        continue
+                    yield response
+        finally:
+            for request_id in pending.values():
+                self.terminate(request_id)
+
+
+class KataAnalysis(BaseKataAnalysis):
+    def __init__(
+        self,
+        config: Settings,
+        override_config: dict[str, Any] | None = None,
+    ):
+        self.output_path = config.output_path
+        self.validate_responses = config.validate_responses
+
+        self._futures: dict[str, Future[KataResponse]] = {}
+        self._callbacks: dict[str, OnUpdate] = {}
+        self._shapes: dict[str, tuple[int, int]] = {}
+        # identical requests in flight share one engine query
+        self._coalesced: dict[str, str] = {}
+        self._keys: dict[str, str] = {}
+        self._waiters: dict[str, list[str]] = {}
+        self._engine_ids: dict[str, str] = {}
+        # visits asked for by the queries in the engine
+        self._visits: dict[str, int] = {}
+        self.engine_visits = 0
+        self._futures_lock = Lock()
+        self._stdin_lock = Lock()
+
+        cmd = engine_command(config, override_config)
 
         logger.debug("Starting katago engine...")
         logger.debug(" ".join(cmd))
@@ -204,49 +501,331 @@ class KataAnalysis:
             text=True,
         )
 
-        self._stdout_thread = Thread(target=self.collect_results)
+        self._stdout_thread = Thread(target=self.collect_results, daemon=True)
         self._stdout_thread.start()
 
+    def _new_future(self, request_id: str) -> Future[KataResponse]:
+        with self._futures_lock:
+            future = self._futures.get(request_id)
+            if future is None or future.done():
+                future = self._futures[request_id] = Future()
+            return future
+
+    @property
+    def in_flight(self) -> int:
+        with self._futures_lock:
+            return sum(not future.done() for future in self._futures.values())
+
+    def _resolve(
+        self, request_id: str, response: KataResponse | KataErrorResponse
+    ):
+        with self._futures_lock:
+            self._callbacks.pop(request_id, None)
+            self._shapes.pop(request_id, None)
+            if (key := self._keys.pop(request_id, None)) is not None:
+                del self._coalesced[key]
+            # a failed query keeps the visits it asked for
+            requested = self._visits.pop(request_id, 0)
+            if isinstance(response, KataResponse):
+                self.engine_visits += response.rootInfo.visits - requested
+
+            waiters = self._waiters.pop(request_id, [request_id])
+            futures = {}
+            for waiter_id in waiters:
+                self._engine_ids.pop(waiter_id, None)
+                futures[waiter_id] = self._futures.get(waiter_id)
+
+        if all(future is None or future.done() for future in futures.values()):
+            logger.warning(f"Unexpected response for {request_id}")
+            return
+
+        for waiter_id, future in futures.items():
+            if future is None or future.done():
+                continue
+
+            if waiter_id != request_id:
+                response = response.model_copy(update={"id": waiter_id})
+            if isinstance(response, KataErrorResponse):
+                future.set_exception(response_error(response))
+            else:
+                future.set_result(response)
+
     def collect_results(self):
-        while self.engine.poll() is None:
-            line = self.engine.stdout.readline().strip()
+        for line in self.engine.stdout:
+            line = line.strip()
 
             if not line:
                 continue
 
             logger.debug(f"RES> {line}")
 
-            try:
-                response = KataResponse.model_validate_json(line)
-            except ValidationError:
-                response = KataErrorResponse.model_validate_json(line)
+            response = self._parse_response(line)
 
-            response_path = self.output_path / f"{response.id}.json"
+            if response.id is None:
+                logger.warning(f"Response without id: {line}")
+                continue
 
-            with response_path.open("w") as file:
-                file.write(response.model_dump_json(by_alias=True, indent=2))
+            if self.output_path is not None:
+                save_response(self.output_path, response.id, line)
+
+            if isinstance(response, KataErrorResponse):
+                if response_error(response):
+                    self._resolve(response.id, response)
+            elif response.is_during_search:
+                self._report(response)
+            else:
+                self._resolve(response.id, response)
+
+        self._fail_pending(KataAnalysisError("katago engine exited"))
+
+    def _parse_response(self, line: str) -> KataResponse | KataErrorResponse:
+        data = pydantic_core.from_json(line)
+        with self._futures_lock:
+            shape = self._shapes.get(data.get("id"))
+
+        return decode_response(data, shape, self.validate_responses)
+
+    def _fail_pending(self, error: Exception):
+        with self._futures_lock:
+            futures = list(self._futures.values())
+
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _report(self, response: KataResponse):
+        with self._futures_lock:
+            on_update = self._callbacks.get(response.id)
+
+        if on_update is not None and should_terminate(on_update, response):
+            with self._futures_lock:
+                self._callbacks.pop(response.id, None)
+            self.terminate(response.id)
+
+    def _write(self, query: str):
+        with self._stdin_lock:
+            self.engine.stdin.write(f"{query}\n")
+            self.engine.stdin.flush()
+
+    def _join(self, request: KataRequest) -> bool:
+        """
+        Attaches the request to an identical one in flight or registers it
+        as the engine query later identical requests attach to.
+        """
+        key = coalescing_key(request)
+        with self._futures_lock:
+            engine_id = self._coalesced.get(key)
+            if engine_id is None or engine_id == request.id:
+                self._coalesced[key] = request.id
+                self._keys[request.id] = key
+                self._waiters[request.id] = [request.id]
+                return False
+
+            self._waiters[engine_id].append(request.id)
+            self._engine_ids[request.id] = engine_id
+
+        logger.debug(f"REQ> {request.id} joins {engine_id}")
+        return True
+
+    def send_request(
+        self, request: KataRequest, on_update: OnUpdate | None = None
+    ) -> Future[KataResponse]:
+        """
+        Sends the request to the engine. If `on_update` is given, it gets
+        every intermediate report of `reportDuringSearchEvery` and stops
+        the search early by returning True. A request identical to one in
+        flight, apart from its id, waits for that query's response instead
+        of being sent again; streaming requests are always sent.
+        """
+        future = self._new_future(request.id)
+
+        streaming = on_update or request.report_during_search_every
+        if not streaming and self._join(request):
+            return future
 
-    def send_request(self, request: KataRequest):
         logger.debug(f"REQ> {request}")
 
         query = request.model_dump_json(by_alias=True, exclude_none=True)
 
-        response_path = self.output_path / f"{request.id}.json"
+        with self._futures_lock:
+            self._shapes[request.id] = (
+                request.board_y_size,
+                request.board_x_size,
+            )
+            if on_update is not None:
+                self._callbacks[request.id] = on_update
+            self._visits[request.id] = request.max_visits or 0
+            self.engine_visits += self._visits[request.id]
+
+        self._write(query)
+
+        return future
+
+    def terminate(self, request_id: str):
+        """
+        Stops the query of `request_id`. While other requests still wait
+        for a shared query, only this request is failed.
+        """
+        with self._futures_lock:
+            engine_id = self._engine_ids.pop(request_id, request_id)
+            waiters = self._waiters.get(engine_id, [])
+            shared = request_id in waiters and len(waiters) > 1
+            if shared:
+                waiters.remove(request_id)
+                future = self._futures.get(request_id)
+
+        if not shared:
+            logger.debug(f"Terminating {engine_id}")
+            self._write(terminate_query(engine_id))
+        elif future is not None and not future.done():
+            future.set_exception(
+                KataAnalysisError(f"{request_id}: terminated without results")
+            )
+
+    def get(
+        self, request_id: str, timeout: float | None = None
+    ) -> KataResponse:
+        with self._futures_lock:
+            future = self._futures[request_id]
+
         try:
-            os.remove(response_path)
-        except FileNotFoundError:
-            pass
+            return future.result(timeout)
+        finally:
+            if future.done():
+                with self._futures_lock:
+                    if self._futures.get(request_id) is future:
+                        del self._futures[request_id]
 
-        self.engine.stdin.write(f"{query}\n")
-        self.engine.stdin.flush()
+    def close(self):
+        self.engine.kill()
+        self.engine.wait()
+        self._stdout_thread.join()
 
-    @retry(
-        retry=retry_if_exception_type(FileNotFoundError),
-        wait=wait_incrementing(1, 0.5, 5),
-        stop=stop_after_attempt(100),
-    )
-    def get(self, request_id: str) -> KataResponse:
-        response_path = self.output_path / f"{request_id}.json"
 
-        with response_path.open() as file:
-            return KataResponse.model_validate_json(file.read())
+class AsyncKataAnalysis:
+    """
+    Asyncio counterpart of `KataAnalysis`. Waiters are plain asyncio
+    futures, so any number of `analyze` calls can be awaited together
+    with `asyncio.gather` while a single task reads the engine output.
+
+        async with AsyncKataAnalysis(config) as kata:
+            responses = await asyncio.gather(*map(kata.analyze, requests))
+    """
+
+    # responses with moves ownership easily exceed the default 64 KiB
+    STREAM_LIMIT = 2**24
+
+    def __init__(self, config: Settings):
+        self.config = config
+        self.output_path = config.output_path
+        self.validate_responses = config.validate_responses
+
+        self.engine: asyncio.subprocess.Process | None = None
+        self._futures: dict[str, asyncio.Future[KataResponse]] = {}
+        self._callbacks: dict[str, OnUpdate] = {}
+        self._shapes: dict[str, tuple[int, int]] = {}
+        self._stdout_task: asyncio.Task | None = None
+
+    async def start(self):
+        cmd = engine_command(self.config)
+
+        logger.debug("Starting katago engine...")
+        logger.debug(" ".join(cmd))
+        self.engine = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=self.STREAM_LIMIT,
+        )
+
+        self._stdout_task = asyncio.create_task(self.collect_results())
+
+    async def collect_results(self):
+        while line := await self.engine.stdout.readline():
+            line = line.decode().strip()
+
+            if not line:
+                continue
+
+            logger.debug(f"RES> {line}")
+
+            data = pydantic_core.from_json(line)
+            response = decode_response(
+                data, self._shapes.get(data.get("id")), self.validate_responses
+            )
+
+            if response.id is None:
+                logger.warning(f"Response without id: {line}")
+                continue
+
+            if self.output_path is not None:
+                save_response(self.output_path, response.id, line)
+
+            future = self._futures.get(response.id)
+
+            if isinstance(response, KataErrorResponse):
+                error = response_error(response)
+                if error and future is not None and not future.done():
+                    future.set_exception(error)
+            elif response.is_during_search:
+                on_update = self._callbacks.get(response.id)
+                if on_update and should_terminate(on_update, response):
+                    del self._callbacks[response.id]
+                    self.terminate(response.id)
+            elif future is not None and not future.done():
+                future.set_result(response)
+            else:
+                logger.warning(f"Unexpected response for {response.id}")
+
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(KataAnalysisError("katago engine exited"))
+
+    async def analyze(
+        self, request: KataRequest, on_update: OnUpdate | None = None
+    ) -> KataResponse:
+        if self.engine is None:
+            raise KataAnalysisError("katago engine is not started")
+
+        if request.id in self._futures:
+            raise KataAnalysisError(f"{request.id}: request already sent")
+
+        logger.debug(f"REQ> {request}")
+
+        query = request.model_dump_json(by_alias=True, exclude_none=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[request.id] = future
+        self._shapes[request.id] = request.board_y_size, request.board_x_size
+        if on_update is not None:
+            self._callbacks[request.id] = on_update
+        try:
+            self.engine.stdin.write(f"{query}\n".encode())
+            await self.engine.stdin.drain()
+            return await future
+        finally:
+            del self._futures[request.id]
+            del self._shapes[request.id]
+            self._callbacks.pop(request.id, None)
+
+    def terminate(self, request_id: str):
+        # no drain here, the reader task must never wait for the engine
+        logger.debug(f"Terminating {request_id}")
+        self.engine.stdin.write(f"{terminate_query(request_id)}\n".encode())
+
+    async def close(self):
+        if self.engine is None:
+            return
+
+        if self.engine.returncode is None:
+            self.engine.kill()
+        await self.engine.wait()
+        await self._stdout_task
+
+    async def __aenter__(self) -> "AsyncKataAnalysis":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
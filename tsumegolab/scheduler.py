@@ -0,0 +1,333 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator, Sequence
+
+import numpy as np
+from loguru import logger
+
+from tsumegolab.canonical import index_problems
+from tsumegolab.config import Settings
+from tsumegolab.kata_analysis import BaseKataAnalysis, KataRequest, PresetRules
+from tsumegolab.solver import Status, solve
+from tsumegolab.tsumego import Color, Tsumego
+from tsumegolab.tsumego_batch import TsumegoBatch
+
+VISITS = (100, 200, 500, 1000)
+
+
+@dataclass
+class Verdict:
+    name: str
+    category: str
+    visits: int
+    settled: bool
+
+
+def make_query(query_id: str, tsumego: Tsumego, visits: int) -> KataRequest:
+    height, width = tsumego.board.shape
+    return KataRequest.model_construct(
+        id=query_id,
+        initial_player=Color.B.name,
+        initial_stones=tsumego.initial_stones,
+        moves=[],
+        rules=PresetRules.JAPANESE,
+        board_x_size=width,
+        board_y_size=height,
+        include_ownership=True,
+        include_ownership_stdev=True,
+        max_visits=visits,
+    )
+
+
+class VisitEscalation:
+    """
+    Solves a collection level by level. Every problem is analysed with
+    the lowest visits first and only problems whose verdict is unsolved
+    or not settled go on to the next level. A verdict is settled when it
+    holds with the ownership threshold moved by `margin` both ways and
+    the mean ownership stdev inside the problem stays under `max_stdev`.
+    No more queries are sent once `budget` visits reached the engine,
+    see `BaseKataAnalysis.engine_visits`, so answers from a cache or
+    shared with an identical query are not charged. The df-pn solver
+    gets `config.solver_nodes` nodes and `config.solver_time` seconds
+    for every problem while the lowest visits are analysed, the problems
+    it proves never reach the engine and are reported with 0 visits.
+    With `paired` the ko and no-ko framings of a problem are in flight
+    together, otherwise the ko one is only sent when the no-ko verdict
+    is wrong, which is slower but spends no visits on ko framings of
+    problems solved without ko.
+    """
+
+    def __init__(
+        self,
+        analysis: BaseKataAnalysis,
+        config: Settings,
+        visits: Sequence[int] = VISITS,
+        budget: int | None = None,
+        margin: float = 0.1,
+        max_stdev: float = 0.25,
+        paired: bool = True,
+    ):
+        self.analysis = analysis
+        self.config = config
+        self.visits = sorted(visits)
+        self.budget = budget
+        self.margin = margin
+        self.max_stdev = max_stdev
+        self.paired = paired
+
+        self._start_visits = analysis.engine_visits
+        self._boards: dict[str, np.ndarray] = {}
+        self._tsumegos: dict[tuple[str, bool], Tsumego] = {}
+        # framed in batches ahead of time, not checked yet
+        self._framed: dict[tuple[str, bool], Tsumego] = {}
+
+    @property
+    def spent(self) -> int:
+        """Visits of this scheduler's queries which reached the engine."""
+        return self.analysis.engine_visits - self._start_visits
+
+    def _tsumego(self, name: str, ko_allowed: bool) -> Tsumego:
+        key = name, ko_allowed
+        if key not in self._tsumegos:
+            self._tsumegos[key] = self._framed.pop(key, None) or Tsumego(
+                self._boards[name],
+                ko_allowed=ko_allowed,
+                wall_distance=self.config.wall_distance,
+                ownership_threshold=self.config.ownership_threshold,
+            )
+            if not self._tsumegos[key].is_frame_alive():
+                logger.warning(f"{name}: frame wall can be killed")
+        return self._tsumegos[key]
+
+    def _frame(self, boards: dict[str, np.ndarray]):
+        """Frames square problems of the same size in one batch."""
+        by_shape: dict[tuple, list[str]] = defaultdict(list)
+        for name, board in boards.items():
+            if board.shape[0] == board.shape[1]:
+                by_shape[board.shape].append(name)
+
+        for names in by_shape.values():
+            for ko_allowed in False, True:
+                batch = TsumegoBatch(
+                    np.stack([boards[name] for name in names]),
+                    ko_allowed=ko_allowed,
+                    wall_distance=self.config.wall_distance,
+                    ownership_threshold=self.config.ownership_threshold,
+                )
+                for i, name in enumerate(names):
+                    self._framed[name, ko_allowed] = batch[i]
+
+    def _queries(
+        self,
+        names: Iterable[str],
+        ko_options: Sequence[bool],
+        visits: int,
+        tsumegos: dict[str, tuple[str, Tsumego]],
+    ) -> Iterator[KataRequest]:
+        """
+        Queries of every framing of the problems, which are added to
+        `tsumegos` by query id as they are sent. The framings of a
+        problem are sent together or not at all.
+        """
+        names = iter(names)
+        for name in names:
+            framings = {
+                f"{name}-{visits}{'-ko' if ko_allowed else ''}": (
+                    name,
+                    self._tsumego(name, ko_allowed),
+                )
+                for ko_allowed in ko_options
+            }
+
+            cost = visits * len(framings)
+            if self.budget is not None and self.spent + cost > self.budget:
+                left_out = 1 + sum(1 for _ in names)
+                logger.info(
+                    f"Visits budget of {self.budget} is spent, "
+                    f"{left_out} problems left out at {visits=}"
+                )
+                return
+
+            tsumegos.update(framings)
+            for query_id, (_, tsumego) in framings.items():
+                yield make_query(query_id, tsumego, visits)
+
+    def _is_settled(self, tsumego: Tsumego, ownership, stdev) -> bool:
+        if not tsumego.is_stable(ownership, self.margin):
+            return False
+        return stdev is None or stdev[tsumego.inside].mean() <= self.max_stdev
+
+    def _analyze(
+        self,
+        names: Iterable[str],
+        ko_options: Sequence[bool],
+        visits: int,
+    ) -> Iterator[tuple[str, bool, bool, bool]]:
+        tsumegos: dict[str, tuple[str, Tsumego]] = {}
+        queries = self._queries(names, ko_options, visits, tsumegos)
+        for response in self.analysis.analyze_many(queries):
+            name, tsumego = tsumegos[response.id]
+            ownership = np.reshape(response.ownership, tsumego.board.shape)
+            stdev = response.ownership_stdev
+            if stdev is not None:
+                stdev = np.reshape(stdev, tsumego.board.shape)
+
+            yield (
+                name,
+                tsumego.ko_allowed,
+                tsumego.is_correct(ownership),
+                self._is_settled(tsumego, ownership, stdev),
+            )
+
+    def _verdict(
+        self, name: str, results: dict[bool, tuple[bool, bool]]
+    ) -> tuple[str, str, bool] | None:
+        """Category of a problem from its framings analysed so far."""
+        if False not in results:
+            return None
+
+        is_correct, settled = results[False]
+        if is_correct:
+            to_kill = self._tsumegos[name, False].to_kill
+            return name, "to_kill" if to_kill else "to_live", settled
+
+        if True not in results:
+            return None
+
+        is_correct, ko_settled = results[True]
+        if is_correct:
+            to_kill = self._tsumegos[name, True].to_kill
+            category = "to_kill_ko" if to_kill else "to_live_ko"
+        else:
+            category = "unsolved"
+        return name, category, settled and ko_settled
+
+    def _classify(
+        self, names: Iterable[str], visits: int
+    ) -> Iterator[tuple[str, str, bool]]:
+        results: dict[str, dict[bool, tuple[bool, bool]]] = defaultdict(dict)
+        classified: set[str] = set()
+
+        def collect(analyzed):
+            for name, ko_allowed, is_correct, settled in analyzed:
+                # the other framing of the problem was enough
+                if name in classified:
+                    continue
+
+                results[name][ko_allowed] = is_correct, settled
+                if verdict := self._verdict(name, results[name]):
+                    classified.add(name)
+                    yield verdict
+
+        ko_options = (False, True) if self.paired else (False,)
+        yield from collect(self._analyze(names, ko_options, visits))
+
+        if not self.paired:
+            ko_names = [name for name in results if name not in classified]
+            yield from collect(self._analyze(ko_names, (True,), visits))
+
+    def _solve(self, name: str) -> Verdict | None:
+        tsumego = self._tsumego(name, ko_allowed=False)
+        result = solve(
+            tsumego, self.config.solver_nodes, self.config.solver_time
+        )
+        logger.debug(f"{name}: {result.status} in {result.nodes} nodes")
+
+        if result.status != Status.PROVEN:
+            return None
+        category = "to_kill" if tsumego.to_kill else "to_live"
+        return Verdict(name, category, visits=0, settled=True)
+
+    def _unproven(
+        self, names: list[str], proven: list[Verdict]
+    ) -> Iterator[str]:
+        """
+        Problems the df-pn solver does not prove, in order. The solver
+        runs on a worker thread, so the engine analyses the problems it
+        gave up on while it works on the next ones. Proofs go to
+        `proven`.
+        """
+        if not self.config.solver_nodes:
+            yield from names
+            return
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            futures = [executor.submit(self._solve, name) for name in names]
+            for name, future in zip(names, futures):
+                if (verdict := future.result()) is None:
+                    yield name
+                else:
+                    proven.append(verdict)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def run(self, boards: dict[str, np.ndarray]) -> Iterator[Verdict]:
+        """
+        Yields the verdict of every problem as soon as it is settled, the
+        problems left unsettled are yielded with their last verdict and
+        the ones left without any, by the budget or failed queries, as
+        `skipped`. Only one of the problems which are mirror images of
+        each other is analysed, the others get its verdict.
+        """
+        members = {
+            problem_class.representative: list(problem_class.members)
+            for problem_class in index_problems(boards).values()
+        }
+        unique = {name: boards[name] for name in members}
+        if len(unique) < len(boards):
+            logger.info(f"{len(boards) - len(unique)} duplicate problems")
+
+        for verdict in self._run(unique):
+            for name in members[verdict.name]:
+                yield replace(verdict, name=name)
+
+    def _run(self, boards: dict[str, np.ndarray]) -> Iterator[Verdict]:
+        pending = dict(boards)
+        verdicts: dict[str, Verdict] = {}
+        proven: list[Verdict] = []
+        self._boards = boards
+        self._frame(boards)
+
+        def settle_proven():
+            while proven:
+                verdict = proven.pop(0)
+                logger.info(verdict)
+                del pending[verdict.name]
+                yield verdict
+
+        for visits in self.visits:
+            if not pending:
+                break
+
+            logger.info(f"Analysing {len(pending)} problems, {visits=}")
+
+            names = list(pending)
+            if visits == self.visits[0]:
+                names = self._unproven(names, proven)
+
+            for name, category, settled in self._classify(names, visits):
+                yield from settle_proven()
+
+                settled = settled and category != "unsolved"
+                verdict = Verdict(name, category, visits, settled)
+                logger.info(verdict)
+
+                if settled:
+                    del pending[name]
+                    verdicts.pop(name, None)
+                    yield verdict
+                else:
+                    verdicts[name] = verdict
+
+            yield from settle_proven()
+
+        yield from verdicts.values()
+
+        for name in pending:
+            if name in verdicts:
+                continue
+            logger.warning(f"{name}: skipped, it has no analysis")
+            yield Verdict(name, "skipped", visits=0, settled=False)
@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+
+import pydantic_core
+import websockets.server
+from loguru import logger
+from pydantic import ValidationError
+from websockets.exceptions import ConnectionClosed
+
+from tsumegolab.kata_analysis import (
+    BaseKataAnalysis,
+    KataAnalysisError,
+    KataErrorResponse,
+    KataRequest,
+    KataResponse,
+    TerminateRequest,
+)
+
+DEFAULT_PORT = 15555
+# responses with moves ownership do not fit the default 1 MiB
+MAX_MESSAGE_SIZE = 2**24
+
+
+class AnalysisServer:
+    """
+    Serves KataGo analysis queries over WebSocket. All connections share
+    `analysis`: query ids get a per connection prefix on the way to the
+    engine and are restored in responses. A connection may have at most
+    `max_in_flight` queries running, its next message is not read until
+    one of them is answered.
+    """
+
+    def __init__(self, analysis: BaseKataAnalysis, max_in_flight: int = 64):
+        self.analysis = analysis
+        self.max_in_flight = max_in_flight
+
+        self._connection_ids = itertools.count()
+        self._tasks: set[asyncio.Task] = set()
+
+    @staticmethod
+    async def _send(connection, message: str):
+        try:
+            await connection.send(message)
+        except ConnectionClosed:
+            pass
+
+    async def _send_error(self, connection, query_id: str | None, error: str):
+        response = KataErrorResponse.model_construct(id=query_id, error=error)
+        await self._send(
+            connection, response.model_dump_json(exclude_none=True)
+        )
+
+    async def _send_response(
+        self, connection, query_id: str, response: KataResponse
+    ):
+        response = response.model_copy(update={"id": query_id})
+        await self._send(
+            connection,
+            response.model_dump_json(by_alias=True, exclude_none=True),
+        )
+
+    async def _analyze(
+        self,
+        connection,
+        prefix: str,
+        request: KataRequest,
+        slots: asyncio.Semaphore,
+    ):
+        loop = asyncio.get_running_loop()
+        engine_id = prefix + request.id
+
+        def report(update: KataResponse):
+            asyncio.run_coroutine_threadsafe(
+                self._send_response(connection, request.id, update), loop
+            )
+
+        try:
+            future = self.analysis.send_request(
+                request.model_copy(update={"id": engine_id}),
+                report if request.report_during_search_every else None,
+            )
+            await asyncio.wrap_future(future)
+            response = self.analysis.get(engine_id)
+        except KataAnalysisError as e:
+            await self._send_error(
+                connection, request.id, str(e).removeprefix(prefix)
+            )
+        else:
+            await self._send_response(connection, request.id, response)
+        finally:
+            slots.release()
+
+    async def _terminate(self, connection, prefix: str, data: dict):
+        query_id, terminate_id = data.get("id"), data.get("terminateId")
+        if terminate_id is None:
+            await self._send_error(connection, query_id, "missing terminateId")
+            return
+
+        self.analysis.terminate(prefix + terminate_id)
+
+        response = TerminateRequest.model_construct(
+            id=query_id, terminate_id=terminate_id
+        )
+        await self._send(connection, response.model_dump_json(by_alias=True))
+
+    async def handle(self, connection):
+        prefix = f"ws{next(self._connection_ids)}:"
+        slots = asyncio.Semaphore(self.max_in_flight)
+        running: dict[str, asyncio.Task] = {}
+
+        logger.info(f"{connection.remote_address} connected as {prefix}")
+        try:
+            async for message in connection:
+                try:
+                    data = pydantic_core.from_json(message)
+                except ValueError as e:
+                    await self._send_error(connection, None, str(e))
+                    continue
+
+                if not isinstance(data, dict):
+                    await self._send_error(connection, None, "expected object")
+                    continue
+
+                if data.get("action") == "terminate":
+                    await self._terminate(connection, prefix, data)
+                    continue
+
+                try:
+                    request = KataRequest.model_validate(data)
+                except ValidationError as e:
+                    await self._send_error(connection, data.get("id"), str(e))
+                    continue
+
+                await slots.acquire()
+                task = asyncio.create_task(
+                    self._analyze(connection, prefix, request, slots)
+                )
+                running[request.id] = task
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(
+                    lambda _, query_id=request.id: running.pop(query_id, None)
+                )
+        except ConnectionClosed:
+            pass
+        finally:
+            logger.info(f"{prefix} disconnected")
+            # let the engine drop the queries nobody waits for anymore
+            for query_id in list(running):
+                self.analysis.terminate(prefix + query_id)
+
+
+async def serve(
+    analysis: BaseKataAnalysis,
+    host: str = "localhost",
+    port: int = DEFAULT_PORT,
+    max_in_flight: int = 64,
+):
+    server = AnalysisServer(analysis, max_in_flight)
+
+    async with websockets.server.serve(
+        server.handle, host, port, max_size=MAX_MESSAGE_SIZE
+    ):
+        logger.info(f"Serving KataGo analysis on ws://{host}:{port}")
+        await asyncio.Future()
@@ -1,32 +1,75 @@
+import mmap
+import os
 import re
 from collections import OrderedDict
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
 reCharsToEscape = re.compile(r"([]\\])")  # characters that need to be \escaped
 reGameTreeStart = re.compile(r"\s*\(")
 reGameTreeEnd = re.compile(r"\s*\)")
 reNodeStart = re.compile(r"\s*;")
-reEscape = re.compile(r"\\")
-reLineBreak = re.compile(r"\r\n?|\n\r?")  # CR, LF, CR/LF, LF/CR
+# a whole bracketed value, any character may be \escaped
+rePropertyValue = re.compile(r"\s*\[([^\\\]]*(?:\\.[^\\\]]*)*)]", re.DOTALL)
+# the opening bracket of a value, unterminated if no whole value matches
+reValueStart = re.compile(r"\s*\[")
+# an escaped character or a soft line break: CR, LF, CR/LF, LF/CR
+reEscaped = re.compile(r"\\(\r\n?|\n\r?|.)", re.DOTALL)
 rePropertyLabel = re.compile(r"\s*([A-Za-z]+)\s*(?=\[)")
-rePropertyStart = re.compile(r"\s*\[")
-rePropertyEnd = re.compile(r"]")
+# what a not parsed variation is skipped by: text, whole values and parens
+reSkipToken = re.compile(
+    r"[^()\[]+|\[[^\\\]]*(?:\\.[^\\\]]*)*]|(?P<open>\()|(?P<close>\))",
+    re.DOTALL,
+)
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+def _bytes_patterns(*patterns: re.Pattern) -> tuple[re.Pattern, ...]:
+    return tuple(
+        re.compile(pattern.pattern.encode(), pattern.flags & ~re.UNICODE)
+        for pattern in patterns
+    )
+
+
+# patterns of the parser for text and for bytes, e.g. a memory-mapped file
+PARSER_PATTERNS = {
+    str: (
+        reGameTreeStart,
+        reGameTreeEnd,
+        reNodeStart,
+        rePropertyLabel,
+        rePropertyValue,
+        reValueStart,
+        reSkipToken,
+    )
+}
+PARSER_PATTERNS[bytes] = _bytes_patterns(*PARSER_PATTERNS[str])
 
 
 def escape_text(text: str) -> str:
     return reCharsToEscape.sub(r"\\\1", text)
 
 
+def unescape_text(text: str) -> str:
+    """Drops escapes and soft line breaks, the inverse of `escape_text`."""
+    if "\\" not in text:
+        return text
+    return reEscaped.sub(
+        lambda m: "" if m.group(1)[0] in "\r\n" else m.group(1), text
+    )
+
+
+CONTROL_CHARS = str.maketrans(
+    "\000\001\002\003\004\005\006\007\010\011\013\014\016\017\020"
+    "\021\022\023\024\025\026\027\030\031\032\033\034\035\036\037",
+    " " * 30,
+)
+
+
 def convert_control_chars(text):
     """Converts control characters in [text] to spaces. Override for variant behaviour."""
-    return text.translate(
-        str.maketrans(
-            "\000\001\002\003\004\005\006\007\010\011\013\014\016\017\020"
-            "\021\022\023\024\025\026\027\030\031\032\033\034\035\036\037",
-            " " * 30,
-        )
-    )
+    return text.translate(CONTROL_CHARS)
 
 
 class ParserError(Exception):
@@ -145,6 +188,53 @@ class SGFTree:
         return self
 
 
+class LazySGFTree(SGFTree):
+    """
+    A tree whose nodes and variations are parsed by `parser` the first
+    time they are accessed, variations are skipped until then.
+    """
+
+    def __init__(self, parser: "SGFParser", index: int):
+        self._parser = parser
+        self._index = index
+        self._trunk: list[SGFNode] = []
+        self._leaves: list[SGFTree] = []
+
+    def _load(self):
+        parser, self._parser = self._parser, None
+        parser.index = self._index
+        self._trunk = parser._parse_trunk().trunk
+
+        while parser._consume_regex(parser._tree_start):
+            self._leaves.append(LazySGFTree(parser, parser.index))
+            parser._skip_tree()
+        parser._consume_regex(parser._tree_end)
+
+    @property
+    def trunk(self) -> list[SGFNode]:
+        if self._parser is not None:
+            self._load()
+        return self._trunk
+
+    @trunk.setter
+    def trunk(self, trunk: list[SGFNode]):
+        if self._parser is not None:
+            self._load()
+        self._trunk = trunk
+
+    @property
+    def leaves(self) -> list[SGFTree]:
+        if self._parser is not None:
+            self._load()
+        return self._leaves
+
+    @leaves.setter
+    def leaves(self, leaves: list[SGFTree]):
+        if self._parser is not None:
+            self._load()
+        self._leaves = leaves
+
+
 class Cursor:
     def __init__(self, tree: SGFTree):
         self.tree = self.root = tree
@@ -198,33 +288,86 @@ class Cursor:
 
 
 class SGFParser:
-    def __init__(self, data: str):
+    """
+    Parses SGF from a string, or from bytes or a memory-mapped file whose
+    values are decoded with `encoding`. Trees are built with an explicit
+    stack, so variations may be nested as deep as memory allows.
+    """
+
+    def __init__(self, data: str | bytes | mmap.mmap, encoding="utf-8"):
         self.data = data
         self.index = 0
 
+        if isinstance(data, str):
+            self.encoding = None
+            patterns = PARSER_PATTERNS[str]
+        else:
+            self.encoding = encoding
+            patterns = PARSER_PATTERNS[bytes]
+            if data[: len(UTF8_BOM)] == UTF8_BOM:
+                self.index = len(UTF8_BOM)
+        (
+            self._tree_start,
+            self._tree_end,
+            self._node_start,
+            self._property_label,
+            self._property_value,
+            self._value_start,
+            self._skip_token,
+        ) = patterns
+
     @classmethod
     def from_file(cls, path: Path):
         with open(path) as f:
             return cls(f.read())
 
+    @classmethod
+    def iter_file(cls, path: Path, encoding="utf-8") -> Iterator[SGFTree]:
+        """
+        Yields the game trees of a file one by one. The file is memory
+        mapped, so only the tree being parsed is kept in memory.
+        """
+        with open(path, "rb") as f:
+            # an empty file cannot be mapped
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from cls(data, encoding).iter_trees()
+
     def _consume_regex(self, pattern: re.Pattern):
         if m := pattern.match(self.data, self.index):
             self.index = m.end()
         return m
 
-    def parse_collection(self) -> list[SGFTree]:
+    def iter_trees(self) -> Iterator[SGFTree]:
         """
-        Parses trees between matching '(' and ')'.
+        Parses trees between matching '(' and ')' one at a time.
         Example: (;AB[dd][ee]B[aa](;W[ab];B[bb])(;W[ba]))
         index                     ^                     ^
                               start                     end
         """
-        trees = []
+        while self._consume_regex(self._tree_start):
+            yield self.parse_tree()
 
-        while self._consume_regex(reGameTreeStart):
-            trees.append(self.parse_tree())
+    def parse_collection(self) -> list[SGFTree]:
+        return list(self.iter_trees())
+
+    def parse_root(self) -> SGFNode:
+        """Parses the root node of the first tree and nothing after it."""
+        if not self._consume_regex(self._tree_start):
+            raise ParserError("no game tree")
+        if not self._consume_regex(self._node_start):
+            raise ParserError("empty tree")
+        return self._parse_node()
 
-        return trees
+    def parse_lazy(self) -> SGFTree:
+        """
+        The first tree, parsed as far as it is navigated, e.g. with
+        `Cursor`. The parser must not be used for anything else then.
+        """
+        if not self._consume_regex(self._tree_start):
+            raise ParserError("no game tree")
+        return LazySGFTree(self, self.index)
 
     def parse_tree(self) -> SGFTree:
         """
@@ -233,64 +376,79 @@ class SGFParser:
         index                      ^            ^
                                start            end
         """
-        trunk = []
-        while self._consume_regex(reNodeStart):
-            trunk.append(self._parse_node())
+        tree = self._parse_trunk()
+        # trees whose variations are not parsed to the end yet
+        stack = [tree]
+        while stack:
+            if self._consume_regex(self._tree_start):
+                leaf = self._parse_trunk()
+                stack[-1].leaves.append(leaf)
+                stack.append(leaf)
+            else:
+                self._consume_regex(self._tree_end)
+                stack.pop()
+
+        return tree
 
-        if not trunk:
+    def _parse_trunk(self) -> SGFTree:
+        tree = SGFTree()
+        while self._consume_regex(self._node_start):
+            tree.trunk.append(self._parse_node())
+
+        if not tree.trunk:
             raise ParserError("empty tree")
 
-        leaves = self.parse_collection()
-        self._consume_regex(reGameTreeEnd)
+        return tree
+
+    def _skip_tree(self):
+        """Moves past the ')' closing a tree without parsing it."""
+        depth = 1
+        for m in self._skip_token.finditer(self.data, self.index):
+            if m.lastgroup == "open":
+                depth += 1
+            elif m.lastgroup == "close":
+                depth -= 1
+                if not depth:
+                    self.index = m.end()
+                    return
 
-        return SGFTree(trunk, leaves)
+        raise ParserError(f"tree at char {self.index} is not closed")
 
     def _parse_node(self) -> SGFNode:
         """
-        Parses single node after consuming ';'.
+        Parses single node after consuming ';', every property with its
+        values between opening '[' and closing ']'.
         Example: (;AB[dd][ee]B[aa](;W[ab];B[bb])(;W[ba]))
         index      ^              ^
                start              end
         """
         node = SGFNode()
-        while m := self._consume_regex(rePropertyLabel):
-            node[m.group(1)] = self._parse_property_values()
-
+        data, index = self.data, self.index
+
+        while label := self._property_label.match(data, index):
+            index = label.end()
+            pv_list = SGFPropValues()
+            while value := self._property_value.match(data, index):
+                index = value.end()
+                text = value.group(1)
+                if self.encoding is not None:
+                    text = text.decode(self.encoding, "replace")
+                pv_list.append(convert_control_chars(unescape_text(text)))
+
+            # the label is followed by '[', so a value is always there
+            if start := self._value_start.match(data, index):
+                raise ParserError(
+                    f"unterminated value at char {start.end() - 1}"
+                )
+
+            key = label.group(1)
+            if self.encoding is not None:
+                key = key.decode("ascii")
+            # values are strings already, no need to convert them again
+            OrderedDict.__setitem__(node, key, pv_list)
+
+        self.index = index
         if not node:
             raise ParserError("empty node")
 
         return node
-
-    def _parse_property_values(self) -> SGFPropValues:
-        """
-        Parses property values between opening '[' and closing ']'.
-        Example: (;AB[dd][ee]B[aa](;W[ab];B[bb])(;W[ba]))
-        index         ^      ^
-                  start      end
-        """
-        pv_list = SGFPropValues()
-
-        while self._consume_regex(rePropertyStart):
-            pv_list.append(self._parse_property_value())
-
-        if not pv_list:
-            raise ParserError(f"empty property at char {self.index}")
-
-        return pv_list
-
-    def _parse_property_value(self) -> str:
-        """
-        Parses single property value between opening '[' and closing ']'.
-        Example: (;AB[dd][ee]B[aa](;W[ab];B[bb])(;W[ba]))
-        index         ^  ^
-                  start  end
-        """
-        value = ""
-        while not self._consume_regex(rePropertyEnd):
-            if self._consume_regex(reEscape):
-                if not self._consume_regex(reLineBreak):
-                    value += self.data[self.index - 1]
-            value += self.data[self.index]
-            self.index += 1
-
-        return convert_control_chars(value)
@@ -0,0 +1,302 @@
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+
+import numpy as np
+from scipy.ndimage import binary_dilation, label
+
+from tsumegolab.benson import alive_stones
+from tsumegolab.bitboard import BitBoard
+from tsumegolab.board import Board, Color, Coord, InvalidMove, liberty_counts
+from tsumegolab.tsumego import Tsumego
+
+INF = 10**9
+
+# a stone, a pass or a ko threat: a pass answered by a pass
+Action = tuple[Coord | None, ...]
+PASS: Action = (None,)
+KO_THREAT: Action = (None, None)
+
+
+class Status(StrEnum):
+    PROVEN = "proven"
+    DISPROVEN = "disproven"
+    UNKNOWN = "unknown"
+
+
+@dataclass
+class SolverResult:
+    status: Status
+    # moves of the normalized problem, None is a pass
+    pv: list[Coord | None]
+    nodes: int
+
+
+class SearchLimit(Exception):
+    pass
+
+
+class DfpnSolver:
+    """
+    Depth-first proof-number search of a framed problem with black to
+    play. Black is the prover: it has to kill the white stones inside
+    the problem if the frame is black, and keep its own stones otherwise.
+    Moves are only searched around the defender, anything further away
+    counts as a pass, and the opponent of black has endless ko threats,
+    so a proof holds without ko. The defender lives when one of its
+    stones is unconditionally alive or its stones survive two passes in
+    a row, a position repeated within a line is a loss for black. The
+    search plays on a `board_type` with the simple ko rule, `Board` or
+    `BitBoard`.
+    """
+
+    def __init__(
+        self,
+        tsumego: Tsumego,
+        max_nodes: int = 20_000,
+        time_limit: float | None = None,
+        board_type: type[Board | BitBoard] = Board,
+    ):
+        self.tsumego = tsumego
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.board_type = board_type
+
+        self.attacker = Color(tsumego.frame_color)
+        self.prover = Color.BLACK
+        self.problem = tsumego.inside & ~tsumego.wall
+        self.region = self._defender_area()
+        self.candidates = self._candidates()
+
+        self.board: Board | BitBoard | None = None
+        self.table: dict[tuple, tuple[int, int]] = {}
+        self.nodes = 0
+        self._passed: list[bool] = []
+        self._path: set[tuple] = set()
+        self._deadline: float | None = None
+
+    def _defender_area(self) -> np.ndarray:
+        """
+        Points of the problem the defender stones reach without crossing
+        an attacker stone, the eye space and the liberties around it,
+        with the attacker stones next to them and the liberties of those
+        which are short of liberties.
+        """
+        board = self.tsumego.tsumego_frame
+        labels, _ = label(self.problem & (board != self.attacker))
+        defender = self.problem & (board == -self.attacker)
+        area = np.isin(labels, np.unique(labels[defender])) & (labels > 0)
+        area = binary_dilation(area) & self.problem
+
+        chains, _ = label(board == self.attacker)
+        liberties = liberty_counts(chains, board == Color.EMPTY)
+        weak = [
+            chain
+            for chain in np.unique(chains[area])
+            if chain and liberties[chain] <= 2
+        ]
+        weak_liberties = binary_dilation(np.isin(chains, weak)) & (
+            board == Color.EMPTY
+        )
+        return area | (weak_liberties & self.problem)
+
+    def _candidates(self) -> list[tuple[Coord, list[Coord]]]:
+        """Points of the search area with their neighbours."""
+        width, height = self.region.shape
+        candidates = []
+        for x, y in np.argwhere(self.region).tolist():
+            neighbours = []
+            for adj_x, adj_y in (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1):
+                if 0 <= adj_x < width and 0 <= adj_y < height:
+                    neighbours.append((adj_x, adj_y))
+            candidates.append(((x, y), neighbours))
+        return candidates
+
+    def _key(self) -> tuple:
+        return self.board.hash, self.board.ko_point, self._passed[-1]
+
+    def _play(self, action: Action):
+        for coord in action:
+            if coord is None:
+                self.board.pass_move()
+            else:
+                self.board.move(*coord)
+        self._passed.append(action == PASS)
+
+    def _unplay(self, action: Action):
+        for _ in action:
+            self.board.undo()
+        self._passed.pop()
+
+    def _terminal(self, action: Action | None) -> bool | None:
+        """Whether the player to move has won, None if the game goes on."""
+        defender_stones = self.board.board[self.problem] == -self.attacker
+        if not defender_stones.any():
+            return self.board.turn == self.attacker
+        if action == PASS and self._passed[-2]:
+            return self.board.turn != self.attacker
+
+        # only a defender stone can make the defender unconditionally alive
+        if self.board.turn == self.attacker and action and action[0]:
+            alive = alive_stones(self.board.board, -self.attacker)
+            if alive[self.problem].any():
+                return False
+        return None
+
+    def _actions(self) -> list[Action]:
+        turn = self.board.turn
+        board = self.board.board.tolist()
+        actions: list[Action] = []
+        for coord, neighbours in self.candidates:
+            if board[coord[0]][coord[1]] != Color.EMPTY:
+                continue
+            colors = [board[adj_x][adj_y] for adj_x, adj_y in neighbours]
+            # black never fills its own eye
+            if turn == self.prover and colors.count(turn) == len(colors):
+                continue
+            # a point next to an empty one is legal and never the ko point
+            if Color.EMPTY not in colors:
+                try:
+                    self.board.check_move(*coord)
+                except InvalidMove:
+                    continue
+            actions.append((coord,))
+
+        if turn != self.prover or turn != self.attacker:
+            actions.append(PASS)
+        if turn != self.prover and self.board.ko_point is not None:
+            actions.append(KO_THREAT)
+        return actions
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SearchLimit(f"{self.max_nodes} nodes searched")
+        if (
+            self._deadline is not None
+            and self.nodes % 256 == 0
+            and time.monotonic() > self._deadline
+        ):
+            raise SearchLimit(f"{self.time_limit}s passed")
+
+    def _evaluate(self, action: Action | None) -> tuple[int, int] | None:
+        won = self._terminal(action)
+        if won is None and self._key() in self._path:
+            won = self.board.turn != self.prover
+        if won is None:
+            return None
+        return (0, INF) if won else (INF, 0)
+
+    def _select(self, children: list[list]):
+        phi, delta = INF, 0
+        best, best_phi, best_delta, second_delta = 0, INF, INF, INF
+        for i, (_, key) in enumerate(children):
+            child_phi, child_delta = self.table.get(key, (1, 1))
+            phi = min(phi, child_delta)
+            delta = min(INF, delta + child_phi)
+            if child_delta < best_delta:
+                second_delta = best_delta
+                best, best_phi, best_delta = i, child_phi, child_delta
+            elif child_delta < second_delta:
+                second_delta = child_delta
+        return phi, delta, best, best_phi, second_delta
+
+    def _mid(
+        self, action: Action | None, phi_threshold: int, delta_threshold: int
+    ) -> tuple:
+        """
+        Searches the current position until its proof or disproof number
+        reaches the threshold and returns its key. Children are only
+        played when they are searched, until then their numbers are 1.
+        """
+        self._count_node()
+        key = self._key()
+        if (numbers := self._evaluate(action)) is not None:
+            self.table[key] = numbers
+            return key
+
+        children = [[child, None] for child in self._actions()]
+
+        self._path.add(key)
+        try:
+            while True:
+                phi, delta, best, best_phi, second_delta = self._select(
+                    children
+                )
+                if phi >= phi_threshold or delta >= delta_threshold:
+                    break
+
+                child = children[best][0]
+                self._play(child)
+                try:
+                    children[best][1] = self._mid(
+                        child,
+                        min(INF, delta_threshold - delta + best_phi),
+                        min(phi_threshold, second_delta + 1),
+                    )
+                finally:
+                    self._unplay(child)
+        finally:
+            self._path.discard(key)
+
+        self.table[key] = phi, delta
+        return key
+
+    def _principal_variation(self, max_length: int = 64) -> list[Coord | None]:
+        pv, played, seen = [], [], set()
+        try:
+            while len(played) < max_length and self._key() not in seen:
+                seen.add(self._key())
+                winning = self.table.get(self._key(), (1, 1))[0] == 0
+                for action in self._actions():
+                    self._play(action)
+                    phi, delta = self.table.get(self._key(), (1, 1))
+                    if (delta == 0) if winning else (phi == 0):
+                        break
+                    self._unplay(action)
+                else:
+                    break
+
+                pv += action
+                played.append(action)
+                if self._terminal(action) is not None:
+                    break
+        finally:
+            for action in reversed(played):
+                self._unplay(action)
+        return pv
+
+    def solve(self) -> SolverResult:
+        # a frame which may die makes the search area meaningless
+        if not self.tsumego.is_frame_alive():
+            return SolverResult(Status.UNKNOWN, [], 0)
+
+        self.board = self.board_type(
+            self.tsumego.tsumego_frame.copy(), turn=self.prover
+        )
+        self.table.clear()
+        self.nodes = 0
+        self._passed = [False]
+        if self.time_limit is not None:
+            self._deadline = time.monotonic() + self.time_limit
+
+        try:
+            self._mid(None, INF, INF)
+        except SearchLimit:
+            pass
+
+        phi, delta = self.table.get(self._key(), (1, 1))
+        if phi == 0:
+            status = Status.PROVEN
+        elif delta == 0:
+            status = Status.DISPROVEN
+        else:
+            return SolverResult(Status.UNKNOWN, [], self.nodes)
+
+        return SolverResult(status, self._principal_variation(), self.nodes)
+
+
+def solve(
+    tsumego: Tsumego, max_nodes: int = 20_000, time_limit: float | None = None
+) -> SolverResult:
+    return DfpnSolver(tsumego, max_nodes, time_limit).solve()
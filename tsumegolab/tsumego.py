@@ -1,10 +1,13 @@
-import itertools
 from dataclasses import dataclass
 from enum import IntEnum
+from functools import cached_property
 
 import numpy as np
 from scipy.ndimage import binary_dilation
 
+from tsumegolab.benson import alive_stones
+from tsumegolab.board import Board
+from tsumegolab.utils.board_utils import checkerboard
 from tsumegolab.utils.coord_utils import int_to_gtp_coord
 
 # fmt: off
@@ -136,11 +139,9 @@ class Tsumego:
     def _tsumego_frame(self) -> np.ndarray[np.int8]:
         tsumego_frame = self.board.astype(np.int8)
 
-        r, c = self.board.shape
-        for i, j in itertools.product(range(r), range(c)):
-            if self.outside[i, j] and i % 2 + j % 2 == 1:
-                tsumego_frame[i, j] = self.frame_color
-
+        tsumego_frame[
+            self.outside & checkerboard(self.board.shape)
+        ] = self.frame_color
         tsumego_frame[self.wall] = self.frame_color
 
         np.putmask(tsumego_frame, self.ko_put_mask, self.ko * self.frame_color)
@@ -165,13 +166,31 @@ class Tsumego:
             self.ko_put_mask,
         )
 
-    @property
+    def is_frame_alive(self) -> bool:
+        """Whether the wall of the frame is unconditionally alive."""
+        wall = self.wall & (self.tsumego_frame == self.frame_color)
+        alive = alive_stones(self.tsumego_frame, self.frame_color)
+        return bool(alive[wall].all())
+
+    def candidate_moves_mask(
+        self, board: Board | None = None, color: Color | None = None
+    ) -> np.ndarray[bool]:
+        """
+        Legal moves of `color` on `board` that stay in the problem area,
+        `board` is the framed problem with black to play by default.
+        """
+        if board is None:
+            board = Board(self.tsumego_frame.copy())
+        return board.legal_moves_mask(color) & self.allowed_moves_mask
+
+    @cached_property
     def initial_stones(self) -> list[tuple[str, str]]:
+        height = self.board.shape[0]
         stones = []
         for coord in np.argwhere(self.tsumego_frame == Color.B):
-            stones.append((Color.B.name, int_to_gtp_coord(coord)))
+            stones.append((Color.B.name, int_to_gtp_coord(coord, height)))
         for coord in np.argwhere(self.tsumego_frame == Color.W):
-            stones.append((Color.W.name, int_to_gtp_coord(coord)))
+            stones.append((Color.W.name, int_to_gtp_coord(coord, height)))
         return stones
 
     @property
@@ -183,16 +202,27 @@ class Tsumego:
         ownership: np.ndarray[float],
         mask: np.ndarray[bool],
         color: Color,
+        threshold: float | None = None,
     ):
-        if color == Color.B:
-            return np.all(ownership[mask] > self.ownership_threshold)
-        return np.all(ownership[mask] < -self.ownership_threshold)
+        if threshold is None:
+            threshold = self.ownership_threshold
 
-    def is_correct(self, ownership: np.ndarray) -> bool:
-        group_all_black = self.is_owned_by(ownership, self.inside, Color.B)
-        group_all_white = self.is_owned_by(ownership, self.inside, Color.W)
-        ko_all_black = self.is_owned_by(ownership, self.ko_check_mask, Color.B)
-        ko_all_white = self.is_owned_by(ownership, self.ko_check_mask, Color.W)
+        if color == Color.B:
+            return np.all(ownership[mask] > threshold)
+        return np.all(ownership[mask] < -threshold)
+
+    def is_correct(
+        self, ownership: np.ndarray, threshold: float | None = None
+    ) -> bool:
+        inside, ko = self.inside, self.ko_check_mask
+        group_all_black = self.is_owned_by(
+            ownership, inside, Color.B, threshold
+        )
+        group_all_white = self.is_owned_by(
+            ownership, inside, Color.W, threshold
+        )
+        ko_all_black = self.is_owned_by(ownership, ko, Color.B, threshold)
+        ko_all_white = self.is_owned_by(ownership, ko, Color.W, threshold)
 
         if self.to_kill:
             if self.ko_allowed:
@@ -205,6 +235,15 @@ class Tsumego:
             else:
                 return not group_all_white and not ko_all_white
 
+    def is_stable(self, ownership: np.ndarray, margin: float) -> bool:
+        """Whether the verdict holds with the threshold moved by `margin`."""
+        verdict = self.is_correct(ownership)
+        return all(
+            self.is_correct(ownership, self.ownership_threshold + delta)
+            == verdict
+            for delta in (-margin, margin)
+        )
+
     def print_frame(self):
         for row in self.tsumego_frame:
             for cell in row:
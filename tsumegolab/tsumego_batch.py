@@ -0,0 +1,244 @@
+from dataclasses import dataclass
+from functools import cache
+
+import numpy as np
+from scipy.ndimage import binary_dilation
+
+from tsumegolab.tsumego import (
+    KO_THREAT_DEFENCE,
+    KO_THREAT_OFFENCE,
+    Color,
+    RotationSpec,
+    Tsumego,
+)
+from tsumegolab.utils.board_utils import checkerboard
+from tsumegolab.utils.coord_utils import int_to_gtp_coord
+
+# the 8 neighbours on the same board only
+STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+STRUCTURE[1] = True
+
+
+def _ko_threats(
+    shape: tuple[int, int], ko_threat: np.ndarray, check_all: bool
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """A ko threat in the corner, the points it covers and checks."""
+    ko_x, ko_y = ko_threat.shape
+    ko = np.zeros(shape, dtype=np.int8)
+    ko[-ko_x:, -ko_y:] = ko_threat
+
+    ko_put_mask = np.zeros(shape, dtype=bool)
+    ko_put_mask[-ko_x:, -ko_y:] = True
+
+    if check_all:
+        ko_check_mask = ko_put_mask.copy()
+    else:
+        ko_check_mask = np.zeros(shape, dtype=bool)
+        ko_check_mask[-ko_x + 1 :, -ko_y + 1 :] = True
+    return ko, ko_put_mask, ko_check_mask
+
+
+@cache
+def _stones(shape: tuple[int, int], color: Color) -> np.ndarray:
+    """The `initial_stones` entry of a stone on every point."""
+    stones = np.empty(shape, dtype=object)
+    for coord in np.ndindex(shape):
+        stones[coord] = color.name, int_to_gtp_coord(coord, shape[0])
+    return stones
+
+
+def _first_stones_sum(boards: np.ndarray, axis: int) -> np.ndarray:
+    """Sum of the first stones of every line along `axis`, from the end."""
+    flipped = np.flip(boards, axis=(1, 2))
+    first = np.argmax(flipped != 0, axis=axis, keepdims=True)
+    return np.take_along_axis(flipped, first, axis=axis).sum(axis=(1, 2))
+
+
+@dataclass
+class OwnershipMargins:
+    """
+    Lowest and highest ownership inside every problem and on its ko
+    check mask, which is all a verdict compares with the threshold.
+    An empty mask has the lowest +inf and the highest -inf.
+    """
+
+    inside_min: np.ndarray
+    inside_max: np.ndarray
+    ko_min: np.ndarray
+    ko_max: np.ndarray
+
+
+class TsumegoBatch:
+    """
+    `Tsumego` of a stack of N square problems in an (N, H, W) array,
+    every mask is computed for all the problems at once and stacked the
+    same way. `batch[i]` is the `Tsumego` of the i-th problem.
+    """
+
+    def __init__(
+        self,
+        boards: np.ndarray,
+        ko_allowed: bool | np.ndarray,
+        wall_distance: int,
+        ownership_threshold: float,
+    ):
+        boards = np.asarray(boards, dtype=np.int8)
+        if boards.shape[1] != boards.shape[2]:
+            raise ValueError("boards must be square")
+
+        self.ko_allowed = np.broadcast_to(ko_allowed, len(boards)).copy()
+        self.ownership_threshold = ownership_threshold
+        (
+            self.boards,
+            self.flip_x,
+            self.flip_y,
+            self.transpose,
+        ) = self._normalize_rotation(boards)
+        self.frame_color = self._frame_color()
+        self.ko, self.ko_put_mask, self.ko_check_mask = self._ko_threat()
+        self.inside = binary_dilation(self.boards, STRUCTURE, wall_distance)
+        self.outside = binary_dilation(~self.inside, STRUCTURE)
+        self.wall = self.inside & self.outside
+        self.tsumego_frame = self._tsumego_frame()
+        self.allowed_moves_mask = (self.inside & ~self.wall) | self.ko_put_mask
+        self.initial_stones = self._initial_stones()
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    @property
+    def to_kill(self) -> np.ndarray:
+        return self.frame_color == Color.B
+
+    @staticmethod
+    def _normalize_rotation(boards: np.ndarray) -> tuple[np.ndarray, ...]:
+        stones = boards != 0
+        count = np.maximum(stones.sum(axis=(1, 2)), 1)
+        center = (boards.shape[1] - 1) / 2
+        x = np.sum(stones * np.arange(boards.shape[1])[:, None], (1, 2))
+        y = np.sum(stones * np.arange(boards.shape[2]), (1, 2))
+        x, y = x / count - center, y / count - center
+
+        flip_x, flip_y, transpose = x > 0, y > 0, abs(x) < abs(y)
+        boards = np.where(flip_x[:, None, None], boards[:, ::-1], boards)
+        boards = np.where(flip_y[:, None, None], boards[:, :, ::-1], boards)
+        boards = np.where(
+            transpose[:, None, None], boards.transpose(0, 2, 1), boards
+        )
+        return boards, flip_x, flip_y, transpose
+
+    def _frame_color(self) -> np.ndarray:
+        colors_sum = _first_stones_sum(self.boards, axis=1)
+        colors_sum += _first_stones_sum(self.boards, axis=2)
+        return np.where(colors_sum > 0, Color.B, Color.W).astype(np.int8)
+
+    def _ko_threat(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        shape = self.boards.shape[1:]
+        # to kill and ko not allowed OR to live and ko is allowed
+        defence = (self.ko_allowed ^ self.to_kill)[:, None, None]
+        return tuple(
+            np.where(defence, *pair)
+            for pair in zip(
+                _ko_threats(shape, KO_THREAT_DEFENCE, check_all=True),
+                _ko_threats(shape, KO_THREAT_OFFENCE, check_all=False),
+            )
+        )
+
+    def _tsumego_frame(self) -> np.ndarray:
+        frame_color = self.frame_color[:, None, None]
+        framed = self.wall | (
+            self.outside & checkerboard(self.boards.shape[1:])
+        )
+        tsumego_frame = np.where(framed, frame_color, self.boards)
+        return np.where(
+            self.ko_put_mask, self.ko * frame_color, tsumego_frame
+        ).astype(np.int8)
+
+    def _initial_stones(self) -> list[list[tuple[str, str]]]:
+        boards = np.arange(len(self) + 1)
+        stones = [[] for _ in range(len(self))]
+        for color in Color.B, Color.W:
+            index, x, y = np.nonzero(self.tsumego_frame == color)
+            colored = _stones(self.boards.shape[1:], color)[x, y]
+            bounds = np.searchsorted(index, boards).tolist()
+            for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+                stones[i] += colored[start:end].tolist()
+        return stones
+
+    def margins(self, ownership: np.ndarray) -> OwnershipMargins:
+        """Ownership margins of an (N, H, W) stack of ownership arrays."""
+        ownership = np.reshape(ownership, self.boards.shape)
+
+        def extremes(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            return (
+                np.min(ownership, axis=(1, 2), where=mask, initial=np.inf),
+                np.max(ownership, axis=(1, 2), where=mask, initial=-np.inf),
+            )
+
+        return OwnershipMargins(
+            *extremes(self.inside), *extremes(self.ko_check_mask)
+        )
+
+    def is_correct(
+        self,
+        margins: OwnershipMargins,
+        thresholds: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        `Tsumego.is_correct` of every problem (rows) with every threshold
+        (columns), the ownership threshold of the batch by default.
+        """
+        if thresholds is None:
+            thresholds = [self.ownership_threshold]
+        threshold = np.asarray(thresholds)[np.newaxis]
+
+        group_all_black = margins.inside_min[:, None] > threshold
+        group_all_white = margins.inside_max[:, None] < -threshold
+        ko_all_black = margins.ko_min[:, None] > threshold
+        ko_all_white = margins.ko_max[:, None] < -threshold
+
+        to_kill = self.to_kill[:, None]
+        ko_allowed = self.ko_allowed[:, None]
+        return np.where(
+            to_kill,
+            np.where(
+                ko_allowed,
+                group_all_black | ~ko_all_white,
+                group_all_black & ko_all_black,
+            ),
+            np.where(
+                ko_allowed,
+                ~group_all_white | ko_all_black,
+                ~group_all_white & ~ko_all_white,
+            ),
+        )
+
+    def is_stable(
+        self, margins: OwnershipMargins, margin: float
+    ) -> np.ndarray:
+        """Whether each verdict holds with the threshold moved by `margin`."""
+        threshold = self.ownership_threshold
+        verdicts = self.is_correct(
+            margins, [threshold - margin, threshold, threshold + margin]
+        )
+        return np.all(verdicts == verdicts[:, 1:2], axis=1)
+
+    def __getitem__(self, i: int) -> Tsumego:
+        tsumego = Tsumego.__new__(Tsumego)
+        tsumego.ko_allowed = bool(self.ko_allowed[i])
+        tsumego.ownership_threshold = self.ownership_threshold
+        tsumego.board = self.boards[i]
+        tsumego.rotation_spec = RotationSpec(
+            bool(self.flip_x[i]), bool(self.flip_y[i]), bool(self.transpose[i])
+        )
+        tsumego.frame_color = Color(self.frame_color[i])
+        tsumego.ko = self.ko[i]
+        tsumego.ko_put_mask = self.ko_put_mask[i]
+        tsumego.ko_check_mask = self.ko_check_mask[i]
+        tsumego.inside = self.inside[i]
+        tsumego.outside = self.outside[i]
+        tsumego.wall = self.wall[i]
+        tsumego.tsumego_frame = self.tsumego_frame[i]
+        tsumego.allowed_moves_mask = self.allowed_moves_mask[i]
+        tsumego.initial_stones = self.initial_stones[i]
+        return tsumego
@@ -1,6 +1,12 @@
+import itertools
+
 import numpy as np
 
 RotationSpec = tuple[bool, bool, bool]
+# the 8 symmetries of a board
+ROTATION_SPECS: list[RotationSpec] = list(
+    itertools.product((False, True), repeat=3)
+)
 
 
 def normalize_rotation(board: np.ndarray) -> tuple[np.ndarray, RotationSpec]:
@@ -17,6 +23,20 @@ def normalize_rotation(board: np.ndarray) -> tuple[np.ndarray, RotationSpec]:
     return board, (flip_x, flip_y, transpose)
 
 
+def transform_board(board: np.ndarray, spec: RotationSpec) -> np.ndarray:
+    """Applies `spec` the way `normalize_rotation` does."""
+    flip_x, flip_y, transpose = spec
+
+    if flip_x:
+        board = np.flip(board, axis=0)
+    if flip_y:
+        board = np.flip(board, axis=1)
+    if transpose:
+        board = np.transpose(board)
+
+    return board
+
+
 def rotate_board(board: np.ndarray, spec: RotationSpec) -> np.ndarray:
     flip_x, flip_y, transpose = spec
 
@@ -28,3 +48,44 @@ def rotate_board(board: np.ndarray, spec: RotationSpec) -> np.ndarray:
         board = np.flip(board, axis=0)
 
     return board
+
+
+def normalize_coord(
+    coord: tuple[int, int], shape: tuple[int, int], spec: RotationSpec
+) -> tuple[int, int]:
+    """Maps a point of a `shape` board the way `normalize_rotation` does."""
+    flip_x, flip_y, transpose = spec
+    height, width = shape
+    x, y = coord
+
+    if flip_x:
+        x = height - 1 - x
+    if flip_y:
+        y = width - 1 - y
+    if transpose:
+        x, y = y, x
+
+    return x, y
+
+
+def rotate_coord(
+    coord: tuple[int, int], shape: tuple[int, int], spec: RotationSpec
+) -> tuple[int, int]:
+    """Inverse of `normalize_coord`, `shape` is the not normalized one."""
+    flip_x, flip_y, transpose = spec
+    height, width = shape
+    x, y = coord
+
+    if transpose:
+        x, y = y, x
+    if flip_y:
+        y = width - 1 - y
+    if flip_x:
+        x = height - 1 - x
+
+    return x, y
+
+
+def checkerboard(shape: tuple[int, int]) -> np.ndarray:
+    """Points with an odd sum of coordinates, the frame fills only those."""
+    return np.indices(shape).sum(axis=0) % 2 == 1
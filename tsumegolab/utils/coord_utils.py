@@ -1,7 +1,7 @@
 import string
 
 SGF_COORDS = string.ascii_lowercase[:19]
-GTP_COORDS = string.ascii_uppercase[:20].replace("I", "")
+GTP_COORDS = string.ascii_uppercase.replace("I", "")
 
 
 def sgf_to_int_coord(coord: str) -> tuple:
@@ -14,14 +14,14 @@ def int_to_sgf_coord(coord: tuple) -> str:
     return f"{SGF_COORDS[y]}{SGF_COORDS[x]}"
 
 
-def int_to_gtp_coord(coord: tuple[int, int]) -> str:
+def int_to_gtp_coord(coord: tuple[int, int], height: int = 19) -> str:
     x, y = coord
-    return f"{GTP_COORDS[y]}{19 - x}"
+    return f"{GTP_COORDS[y]}{height - x}"
 
 
-def gtp_to_int_coord(coord: str) -> tuple[int, int]:
+def gtp_to_int_coord(coord: str, height: int = 19) -> tuple[int, int]:
     x, y = coord[0], int(coord[1:])
-    return 19 - y, GTP_COORDS.index(x)
+    return height - y, GTP_COORDS.index(x)
 
 
 def sgf_to_gtp_coord(coord: str) -> str:
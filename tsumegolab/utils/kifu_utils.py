@@ -24,10 +24,16 @@ def sgf_to_initial_stones_and_allowed_moves(path: Path | str):
     return initial_stones, inside, color
 
 
+def sgf_root_node(path: str | Path) -> SGFNode:
+    # variations are never parsed, only the root node is needed
+    return SGFParser.from_file(Path(path)).parse_root()
+
+
 def sgf_root_to_board(path: str | Path) -> np.ndarray:
-    sgf_parser = SGFParser.from_file(Path(path))
-    tree = sgf_parser.parse_collection()
-    root_node = tree[0].trunk[0]
+    return root_node_to_board(sgf_root_node(path))
+
+
+def root_node_to_board(root_node: SGFNode) -> np.ndarray:
     size = root_node.get("SZ", ["19"])[0]
 
     if ":" in size:
@@ -76,15 +82,10 @@ def make_root_node(board: np.ndarray) -> SGFNode:
 
 
 def save_board_to_sgf(board: Board, path: Path):
-    if board.history:
-        initial_board, *_ = board.history[0]
-    else:
-        initial_board = board.board
-
-    tree = SGFTree([make_root_node(initial_board)])
+    tree = SGFTree([make_root_node(board.initial_board)])
 
-    for _, move, _ in board.history:
-        sgf_coord = int_to_sgf_coord(move.coord)
+    for move in (record.move for record in board.history):
+        sgf_coord = "" if move.coord is None else int_to_sgf_coord(move.coord)
         if move.color == Color.BLACK:
             node = SGFNode({"B": SGFPropValues([sgf_coord])})
         else:
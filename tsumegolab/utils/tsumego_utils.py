@@ -1,9 +1,11 @@
-import itertools
-
 import numpy as np
 from scipy.ndimage import binary_dilation
 
-from tsumegolab.utils.board_utils import normalize_rotation, rotate_board
+from tsumegolab.utils.board_utils import (
+    checkerboard,
+    normalize_rotation,
+    rotate_board,
+)
 
 edge_structure = np.ones((3, 3))
 
@@ -41,14 +43,7 @@ def get_outside_mask(inside_mask: np.ndarray) -> np.ndarray:
 def tsumego_frame_mask(
     inside_mask: np.ndarray, outside_mask: np.ndarray
 ) -> np.ndarray:
-    outside = np.copy(outside_mask)
-
-    r, c = inside_mask.shape
-    for i, j in itertools.product(range(r), range(c)):
-        outside[i, j] = outside[i, j] and i % 2 + j % 2 == 1
-
-    outside[inside_mask & outside_mask] = True
-    return outside
+    return outside_mask & (checkerboard(inside_mask.shape) | inside_mask)
 
 
 def guess_outside_color(board: np.ndarray):